@@ -1,489 +1,130 @@
 
 
-from flask import Flask, render_template_string, request, send_file, redirect, url_for
-import pandas as pd
-import threading
-import webbrowser
-from ortools.sat.python import cp_model
+from flask import Flask, Request, Response, render_template, request, send_file, redirect, url_for, jsonify
+from jinja2 import DictLoader
 import os
-from werkzeug.utils import secure_filename
-import random
+import io
+import csv
+import json
+import logging
+import tempfile
+import threading
+import zipfile
+from html import escape
+import time
+from jobs import JobManager, QueueFullError, FINISHED, FAILED
+from cache import upload_digest, store_upload, prune_uploads, cache_key, result_cache_from_config
+from store import ResultStore
+from metrics import REGISTRY, record_job
+from settings import MIN_SEARCH_WORKERS, settings_from_env, settings_from_request
+from delta import parse_delta, combine_deltas
+from batch_upload import BatchError, batch_html, zip_workbooks
+from sheets import check_sheets
 
 app = Flask(__name__)
 
+# LOG_LEVEL=DEBUG also logs each solved timetable and model-building details;
+# WARNING keeps the solve path quiet
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
 # Configure upload folder
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'xlsx'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Ensure upload folder exists
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-# Sample dataset file (Provide an actual path or remove if unnecessary)
-SAMPLE_DATASET_PATH ="C:/Users/DELL/OneDrive/Documents/CSPDATA1sample - CSM.xlsx"
+# Uploaded files stay in memory up to UPLOAD_SPOOL_BYTES (larger ones spill
+# to a temporary file) while their sheets are checked and their content
+# hashed; a workbook is written to UPLOAD_FOLDER only when a solve needs it.
+# Requests over MAX_UPLOAD_BYTES (BATCH_MAX_UPLOAD_BYTES for /batch) are
+# refused with 413 as soon as they arrive.
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', 32 * 1024 * 1024)) or None
+app.config['UPLOAD_SPOOL_BYTES'] = int(os.environ.get('UPLOAD_SPOOL_BYTES', 8 * 1024 * 1024))
+
+# Stored workbooks unused for UPLOAD_MAX_AGE seconds are deleted (0 keeps
+# them); a timetable can only be re-solved while its workbook is kept. Each
+# web worker sweeps the folder on upload, at most once an interval.
+app.config['UPLOAD_MAX_AGE'] = int(os.environ.get('UPLOAD_MAX_AGE', 7 * 24 * 3600))  # seconds
+app.config['UPLOAD_SWEEP_INTERVAL'] = int(os.environ.get('UPLOAD_SWEEP_INTERVAL', 3600))  # seconds
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_BYTES'])
+
+
+app.request_class = UploadRequest
+
+# Solve jobs run on a bounded process pool so web workers never block on CP-SAT
+app.config['SOLVER_MAX_WORKERS'] = int(os.environ.get('SOLVER_MAX_WORKERS', 2))  # concurrent solves
+app.config['SOLVER_MAX_QUEUE'] = int(os.environ.get('SOLVER_MAX_QUEUE', 8))  # jobs waiting for a worker
+
+# Finished jobs are kept in SQLite so results survive restarts and are
+# shared by all web workers (empty path disables the store)
+app.config['RESULT_STORE_PATH'] = os.environ.get('RESULT_STORE_PATH', 'results.db')
+result_store = ResultStore(app.config['RESULT_STORE_PATH']) if app.config['RESULT_STORE_PATH'] else None
+
+# Runs in the web process for every finished job. Each workbook of a batch
+# becomes a job of its own, "<batch id>-<n>", so it has the usual result
+# pages and exports.
+def finish_job(job_id, result, created):
+    for i, (entry, workbook_result) in enumerate(zip(result.get("batch", []), result.pop("results", [])), 1):
+        entry["job_id"] = job_manager.add_result(workbook_result, job_id=f"{job_id}-{i}")
+    if result_store is not None:
+        result_store.save(job_id, result, created)
+
+# The web tier never imports the solver (OR-Tools, pandas, the model): jobs
+# name their entry point and run in pool workers that load these modules.
+# SOLVER_START_METHOD picks how the workers start; forkserver (the default
+# where available) imports the modules once in a server process every
+# worker forks from.
+SOLVER_MODULES = ("timetable", "incremental", "batch")
+app.config['SOLVER_START_METHOD'] = os.environ.get('SOLVER_START_METHOD') or None  # fork, forkserver or spawn
+job_manager = JobManager(max_workers=app.config['SOLVER_MAX_WORKERS'], max_queue=app.config['SOLVER_MAX_QUEUE'],
+                         on_finish=finish_job, start_method=app.config['SOLVER_START_METHOD'],
+                         preload=SOLVER_MODULES)
+
+# /batch takes a zip of workbooks or several workbooks and solves them as one job
+app.config['BATCH_MAX_WORKBOOKS'] = int(os.environ.get('BATCH_MAX_WORKBOOKS', 64))
+app.config['BATCH_MAX_BYTES'] = int(os.environ.get('BATCH_MAX_BYTES', 256 * 1024 * 1024))  # unpacked zip members
+app.config['BATCH_MAX_UPLOAD_BYTES'] = int(os.environ.get('BATCH_MAX_UPLOAD_BYTES', 128 * 1024 * 1024)) or None
+
+# /jobs/<id>/events streams solver progress; each open stream holds one web thread
+app.config['EVENTS_POLL_INTERVAL'] = float(os.environ.get('EVENTS_POLL_INTERVAL', 0.5))  # seconds
+app.config['EVENTS_KEEPALIVE'] = float(os.environ.get('EVENTS_KEEPALIVE', 15))  # seconds
+# Streams open at once per web worker; the default leaves half of gunicorn's
+# threads (WEB_THREADS) for everything else. Pages past the cap poll /jobs/<id>.
+app.config['EVENTS_MAX_STREAMS'] = int(os.environ.get('EVENTS_MAX_STREAMS',
+                                                      max(1, int(os.environ.get('WEB_THREADS', 8)) // 2)))
+app.config['EVENTS_FALLBACK_POLL'] = float(os.environ.get('EVENTS_FALLBACK_POLL', 2))  # seconds
+event_streams = threading.BoundedSemaphore(app.config['EVENTS_MAX_STREAMS'])
+
+# CP-SAT defaults for this deployment (SOLVER_NUM_WORKERS, SOLVER_MAX_TIME,
+# SOLVER_RELATIVE_GAP, SOLVER_RANDOM_SEED, SOLVER_RETURN_BEST_FEASIBLE).
+# Cores are split between the concurrent solves unless configured otherwise,
+# with at least MIN_SEARCH_WORKERS each (see settings.py).
+app.config['SOLVER_SETTINGS'] = settings_from_env(
+    default_workers=max(MIN_SEARCH_WORKERS, (os.cpu_count() or 1) // app.config['SOLVER_MAX_WORKERS']))
+
+# Solved timetables are cached by workbook content hash + solver parameters
+app.config['RESULT_CACHE_BACKEND'] = os.environ.get('RESULT_CACHE_BACKEND', 'disk')  # disk, memory or none
+app.config['RESULT_CACHE_DIR'] = os.environ.get('RESULT_CACHE_DIR', 'cache')
+app.config['RESULT_CACHE_MAX_ENTRIES'] = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 256))
+app.config['RESULT_CACHE_MAX_BYTES'] = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+app.config['RESULT_CACHE_MAX_AGE'] = int(os.environ.get('RESULT_CACHE_MAX_AGE', 7 * 24 * 3600))  # seconds
+result_cache = result_cache_from_config(app.config)
+
+# Solved timetables are rendered a page of sections at a time
+app.config['RESULT_PAGE_SIZE'] = int(os.environ.get('RESULT_PAGE_SIZE', 10))  # sections per page
+
+# Sample dataset offered by /download: this workbook when set, otherwise a
+# small synthetic one generated on request
+app.config['SAMPLE_DATASET_PATH'] = os.environ.get('SAMPLE_DATASET_PATH', '')
 
 # Function to check if the file extension is allowed
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Function to generate the timetable
-def generate_timetable(file_path):
-    try:
-        # Load Excel file
-        df_sections = pd.read_excel(file_path, sheet_name="Sections Data")
-        df_subjects = pd.read_excel(file_path, sheet_name="Subjects Data")
-        df_teachers = pd.read_excel(file_path, sheet_name="Teachers Data")
-        df_timeslots = pd.read_excel(file_path, sheet_name="Time Slot Data")
-        df_section_subjects = pd.read_excel(file_path, sheet_name="Section Subjects Data")
-        df_fixed_activities = pd.read_excel(file_path, sheet_name="Fixed Activities")
-        df_lab_sessions = pd.read_excel(file_path, sheet_name="Lab Sessions")
-        df_Weekly_Once = pd.read_excel(file_path, sheet_name="WeeklyOnce Subjects")
-        
-        # Extract necessary data
-        sections = df_sections.apply(lambda row: f"{row['Year']}_{row['Department']}_{row['Section']}", axis=1).tolist()
-        days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
-        timeslots_data = df_timeslots.to_dict(orient="records")
-        all_slots = [slot["Slot ID"] for slot in timeslots_data]
-        years = df_sections["Year"].astype(str).unique().tolist()        
-        subject_dict = dict(zip(df_subjects['Subject ID'], df_subjects['Subject Name']))
-        
-        # Mapping sections to subjects and assigned faculty
-        section_subject_mapping = {}
-        for _, row in df_section_subjects.iterrows():
-            section_key = f"{row['Year']}_{row['Department']}_{row['Section']}"
-            section_subject_mapping.setdefault(section_key, []).append((row["Subject ID"], row["Faculty ID"]))
-        
-        # Mapping sections to lab sessions
-        section_lab_mapping = {}
-        for _, row in df_lab_sessions.iterrows():
-            section_key = f"{row['Year']}_{row['Department']}_{row['Section']}"
-            section_lab_mapping.setdefault(section_key, []).append((row["Subject ID"], row["Faculty ID"]))
-        
-        # Fixed activity mapping
-        fixed_activities = {}
-        for _, row in df_fixed_activities.iterrows():
-            section_key = f"{row['Year']}_{row['Department']}_{row['Section']}"
-            day, slot_id, activity = row["Day"], row["Slot ID"], row["Activity"]
-            fixed_activities.setdefault(section_key, {}).setdefault(day, {})[slot_id] = activity
-        
-        # Define OR-Tools model
-        model = cp_model.CpModel()
-        
-        # Define variables
-        is_subject_assigned = {}
-        WeeklyOnce_vars = {}
-        is_lab_assigned = {}
-        
-        # Precompute slot sets
-        all_slots = {slot["Slot ID"] for slot in timeslots_data}
-        break_slots = {slot["Slot ID"] for slot in timeslots_data if slot.get("Break Type", "None") in ["Break", "Lunch"]}
-        
-        # Step 2: Assign Lab Sessions (Ensure Consecutive Slots)
-        for section in sections:
-            year, dept, sec = section.split("_")  # Extract individual components
-            
-            if section not in section_lab_mapping:  
-                continue  # Skip sections with no lab subjects
-            
-            for subject_id, faculty_id in section_lab_mapping[section]:
-                is_lab_assigned[(section, subject_id)] = []
-                
-                for day in days:
-                    for i in range(len(timeslots_data) - 1):
-                        slot1 = timeslots_data[i]["Slot ID"]
-                        slot2 = timeslots_data[i + 1]["Slot ID"]
-        
-                        if slot1 in break_slots or slot2 in break_slots or slot1 in fixed_activities.get(section, {}).get(day, {}):
-                            continue  # Skip breaks and fixed slots
-        
-                        var = model.NewBoolVar(f"lab_{section}_{subject_id}_{day}_{slot1}_{slot2}")
-                        is_lab_assigned[(section, subject_id)].append((day, slot1, slot2, var))
-        
-                        # Assign labs only if the teacher is available
-                        is_subject_assigned[(section, subject_id, day, slot1)] = var
-                        is_subject_assigned[(section, subject_id, day, slot2)] = var
-        
-        # Prevent lab allocation during fixed activities
-        for section, day_slots in fixed_activities.items():
-            for day, blocked_slots in day_slots.items():
-                for slot_id in blocked_slots:
-                    for subject_id, _ in section_lab_mapping.get(section, []):
-                        for d, s1, s2, var in is_lab_assigned.get((section, subject_id), []):
-                            if d == day and (s1 == slot_id or s2 == slot_id):
-                                model.Add(var == 0)
-        
-        # Constraint: Prevent a Faculty from Teaching Multiple Lab Sections Simultaneously
-        for day in days:
-            for i in range(len(timeslots_data) - 1):
-                overlapping_labs = []
-                for (section, subject_id), slots in is_lab_assigned.items():
-                    for d, s1, s2, var in slots:
-                        if d == day and timeslots_data[i]["Slot ID"] == s1 and timeslots_data[i + 1]["Slot ID"] == s2:
-                            overlapping_labs.append(var)
-        
-                if overlapping_labs:
-                    model.Add(sum(overlapping_labs) <= 1)  # Prevent lab overlap
-        
-        # Constraint: No two sections share the same lab session at the same time
-        for day in days:
-            for i in range(len(timeslots_data) - 1):
-                overlapping_labs = []
-                for (section, subject_id), slots in is_lab_assigned.items():
-                    for d, s1, s2, var in slots:
-                        if d == day and timeslots_data[i]["Slot ID"] == s1 and timeslots_data[i + 1]["Slot ID"] == s2:
-                            overlapping_labs.append(var)
-                if overlapping_labs:
-                    model.Add(sum(overlapping_labs) <= 1)
-        
-        # Ensure no multiple lab sessions on the same day per section
-        for section, labs in section_lab_mapping.items():
-            for day in days:
-                lab_sessions_for_day = []
-                
-                for subject_id, faculty_id in labs:
-                    for d, s1, s2, lab_var in is_lab_assigned.get((section, subject_id), []):
-                        if d == day:
-                            lab_sessions_for_day.append(lab_var)
-                
-                if lab_sessions_for_day:
-                    model.AddAtMostOne(lab_sessions_for_day)
-        
-        # Ensure each lab session is assigned exactly once per week per section
-        for (section, subject_id), slots in is_lab_assigned.items():
-            if slots:
-                model.AddExactlyOne(var for _, _, _, var in slots)
-        
-        # Step 1: Assign Weekly Once Subjects to Available Slots (Filtered by Year)
-        for section in sections:
-            WeeklyOnce_vars[section] = {}
-        
-            # Extract year from section name (assuming format: 'II_CSM_A' → 'II')
-            section_parts = section.split('_')
-            year = section_parts[0] if len(section_parts) >= 2 else None
-        
-            if not year:
-                print(f"Warning: Could not determine year for section {section}")
-                continue
-        
-            # Filter Weekly Once subjects only for the given year
-            relevant_Weekly_Once = df_Weekly_Once[df_Weekly_Once['Year'] == year]
-        
-            for _, subject_row in relevant_Weekly_Once.iterrows():
-                subject_id = subject_row['Subject ID']
-                available_slots = []
-        
-                for day in days:
-                    for slot in all_slots:
-                        if slot in break_slots or slot in fixed_activities.get(section, {}).get(day, {}):
-                            continue  # Skip break & fixed slots
-                        available_slots.append((day, slot))
-        
-                if available_slots:
-                    # Randomly choose ONE slot per subject per section
-                    selected_day, selected_slot = random.choice(available_slots)
-                    var = model.NewBoolVar(f"weekly_{section}_{subject_id}_{selected_day}_{selected_slot}")
-                    WeeklyOnce_vars[section][subject_id] = (selected_day, selected_slot, var)
-                    is_subject_assigned[(section, subject_id, selected_day, selected_slot)] = var
-                else:
-                    print(f"Warning: No available slot for Weekly Once {subject_id} in section {section}")
-        
-        # Step 2: Prevent Weekly Once from Overlapping with Labs
-        for section in sections:
-            for day in days:
-                for slot_id in all_slots:
-                    lab_vars_in_slot = []
-                    Weekly_Once_vars_in_slot = []
-        
-                    for subj, faculty_id in section_lab_mapping.get(section, []):
-                        if (section, subj) in is_lab_assigned:
-                            for d, s1, s2, var in is_lab_assigned.get((section, subj), []):
-                                if d == day and (s1 == slot_id or s2 == slot_id):
-                                    lab_vars_in_slot.append(var)
-        
-                    for subj, (d, s, var) in WeeklyOnce_vars[section].items():
-                        if d == day and s == slot_id:
-                            Weekly_Once_vars_in_slot.append(var)
-                    
-                    if lab_vars_in_slot and Weekly_Once_vars_in_slot:
-                        model.AddAtMostOne(lab_vars_in_slot + Weekly_Once_vars_in_slot)
-        
-        # Step 3: Ensure No Two Weekly Once Subjects are in the Same Slot Within a Section
-        for section in sections:
-            for day in days:
-                for slot_id in all_slots:
-                    slot_vars = [
-                        var for subj, (d, s, var) in WeeklyOnce_vars[section].items() if d == day and s == slot_id
-                    ]
-                    if len(slot_vars) > 1:
-                        model.AddAtMostOne(slot_vars)
-        
-        # Step 4: Ensure Each Weekly Once Subject is Assigned Exactly Once per Week
-        for section in sections:
-            for subject_id in df_Weekly_Once['Subject ID'].unique():
-                if subject_id in WeeklyOnce_vars[section]:
-                    selected_day, selected_slot, var = WeeklyOnce_vars[section][subject_id]
-                    model.AddExactlyOne([var])  # Ensure the subject appears only once per week
-        
-        # Step 3: Assign Regular Subjects (Checking Across All Years)
-        for section in sections:
-            year, dept, sec = section.split("_")
-            section_key = f"{year}_{dept}_{sec}" 
-        
-            for subject_id, faculty_id in section_subject_mapping.get(section_key, []):  
-                assigned = False  # Track if subject is assigned at least once
-                for day in days:
-                    for slot in all_slots:
-                        # Skip if the slot is in break or fixed activities
-                        if slot in break_slots or slot in fixed_activities.get(section_key, {}).get(day, {}):
-                            continue  
-        
-                        # Check if the slot is already taken by lab subjects
-                        lab_conflicts = [
-                            var for (d, s1, s2, var) in is_lab_assigned.get((section_key, subject_id), [])
-                            if d == day and (slot == s1 or slot == s2)  # Correct format
-                        ]
-                        
-                        if lab_conflicts:
-                            print(f"🚫 Conflict: Lab already assigned for {subject_id} in {section_key} on {day}, Slot {slot}")
-                            continue  # Skip since this slot is taken by a lab
-        
-                        # Skip if the slot is already taken by Weekly Once subjects
-                        WeeklyOnce_conflicts = [
-                            var for subj, (d, s, var) in WeeklyOnce_vars.get(section_key, {}).items()
-                            if d == day and s == slot
-                        ]
-                        if WeeklyOnce_conflicts:
-                            continue  # Skip since this slot is taken by a Weekly Once subject
-                        
-                        # Create a new variable for this subject assignment
-                        var = model.NewBoolVar(f"subject_{section_key}_{subject_id}_{day}_{slot}")
-                        is_subject_assigned[(section_key, subject_id, day, slot)] = var
-                        assigned = True  # Mark subject as assignable
-        
-                # Debug: Check if a subject has at least 1 available slot
-                if not assigned:
-                    print(f"⚠ WARNING: No available slots for {subject_id} in {section_key}")
-        
-        # Ensure at most one subject is assigned per section per slot
-        for day in days:
-            for slot in all_slots:
-                for section in sections:
-                    section_key = f"{section}"
-                    subject_vars = [
-                        is_subject_assigned[(section_key, subject_id, day, slot)]
-                        for subject_id, _ in section_subject_mapping.get(section_key, [])
-                        if (section_key, subject_id, day, slot) in is_subject_assigned
-                    ]
-                    if subject_vars:  # Prevent empty list errors
-                        model.AddAtMostOne(subject_vars)  # Only one subject per slot per section
-        
-        # Loosen Constraint: No subject should be assigned more than 2 slots per day
-        for section in sections:
-            section_key = f"{section}"
-            for subject_id, _ in section_subject_mapping.get(section_key, []):
-                for day in days:
-                    subject_day_vars = [
-                        is_subject_assigned[(section_key, subject_id, day, slot_id)]
-                        for slot_id in all_slots
-                        if (section_key, subject_id, day, slot_id) in is_subject_assigned
-                    ]
-                    if subject_day_vars:  # Prevent empty list errors
-                        model.Add(sum(subject_day_vars) <= 2)  # Allow up to 2 slots per day
-        
-        # Loosen Weekly Constraint: Allow 4-5 slots instead of exactly 5
-        for section in sections:
-            section_key = f"{section}"
-            for subject_id, _ in section_subject_mapping.get(section_key, []):
-                assigned_vars = [
-                    is_subject_assigned[(section_key, subject_id, day, slot)]
-                    for day in days
-                    for slot in all_slots
-                    if (section_key, subject_id, day, slot) in is_subject_assigned
-                ]
-                if assigned_vars:  # Prevent empty list errors
-                    model.Add(sum(assigned_vars) >= 5)  # Allow 4-5 slots per week
-        
-        # Define penalty variables for faculty conflicts
-        penalty_vars = []
-        penalty_weight = 5  # Adjust this weight as needed
-        
-        for day in days:
-            for slot in all_slots:
-                faculty_conflict_vars = {}
-        
-                for section in sections:
-                    section_key = f"{section}"  # Ensure section key is consistent
-                    for subject_id, faculty_id in section_subject_mapping.get(section_key, []):
-                        if faculty_id and (section_key, subject_id, day, slot) in is_subject_assigned:
-                            faculty_conflict_vars.setdefault(faculty_id, []).append(
-                                is_subject_assigned[(section_key, subject_id, day, slot)]
-                            )
-        
-                for faculty_id, conflict_vars in faculty_conflict_vars.items():
-                    if len(conflict_vars) > 1:
-                        # Create a penalty variable that activates if there is a conflict
-                        penalty_var = model.NewBoolVar(f"faculty_conflict_{faculty_id}_{day}_{slot}")
-        
-                        # Ensure the conflict constraint is properly enforced
-                        model.Add(sum(conflict_vars) > 1).OnlyEnforceIf(penalty_var)
-                        model.Add(sum(conflict_vars) <= 1).OnlyEnforceIf(penalty_var.Not())
-        
-                        penalty_vars.append(penalty_var)
-        
-        # Minimize faculty conflicts
-        model.Minimize(penalty_weight * sum(penalty_vars))    
-        
-        # Solve model
-        solver = cp_model.CpSolver()
-        status = solver.Solve(model)
-        
-        # Generate timetable output
-        if status in [cp_model.FEASIBLE, cp_model.OPTIMAL]:
-            timetable_dict = {}
-        
-            for year in years:
-                year_sections = [sec for sec in sections if sec.startswith(f"{year}_")]
-        
-                for section in year_sections:
-                    df_timetable = pd.DataFrame(index=days, columns=[ts["Slot ID"] for ts in timeslots_data])
-        
-                    free_slot_count = 0  # Track free periods per section
-        
-                    for day in days:
-                        for timeslot in timeslots_data:
-                            slot_id = timeslot["Slot ID"]
-                            break_type = timeslot.get("Break Type", "None")
-                            slot_assigned = False  # Track slot assignment
-        
-                            # Handle breaks and lunch
-                            if break_type in ["Break", "Lunch"]:
-                                df_timetable.at[day, slot_id] = break_type
-                                continue
-        
-                            # Handle fixed activities
-                            if section in fixed_activities and day in fixed_activities[section]:
-                                if slot_id in fixed_activities[section][day]:
-                                    df_timetable.at[day, slot_id] = fixed_activities[section][day][slot_id]
-                                    continue
-        
-                            # Assign lab sessions first
-                            if section in section_lab_mapping:
-                                for subject_id, _ in section_lab_mapping[section]:
-                                    if (section, subject_id) in is_lab_assigned:
-                                        for d, s1, s2, var in is_lab_assigned[(section, subject_id)]:
-                                            if d == day and (s1 == slot_id or s2 == slot_id) and solver.Value(var) == 1:
-                                                df_timetable.at[day, slot_id] = f"{subject_dict.get(subject_id, 'Unknown Lab')} (Lab)"
-                                                slot_assigned = True
-                                                break
-                                    if slot_assigned:
-                                        break
-        
-                            # Assign Weekly Once next
-                            if not slot_assigned and section in WeeklyOnce_vars:
-                                for subject_id, (d, s, var) in WeeklyOnce_vars[section].items():
-                                    if d == day and s == slot_id and solver.Value(var) == 1:
-                                        df_timetable.at[day, slot_id] = f"{subject_dict.get(subject_id, 'Unknown Weekly Once')}"
-                                        slot_assigned = True
-                                        break
-        
-                            # Assign regular subjects (prioritize section subjects first)
-                            if not slot_assigned:
-                                for subject_id, faculty_id in section_subject_mapping.get(section, []):
-                                    key = (section, subject_id, day, slot_id)
-                                    if key in is_subject_assigned and solver.Value(is_subject_assigned[key]) == 1:
-                                        df_timetable.at[day, slot_id] = f"{subject_dict.get(subject_id, 'Unknown Subject')}"
-                                        slot_assigned = True
-                                        break
-        
-                            # If still empty, mark as "Free" (Ensure max one free slot per week)
-                            if not slot_assigned:
-                                if free_slot_count < 1:  # Limit to one free period per week
-                                    df_timetable.at[day, slot_id] = "Free"
-                                    free_slot_count += 1
-                                else:
-                                    df_timetable.at[day, slot_id] = "Unallocated   "
-        
-                    timetable_dict[section] = df_timetable
-        
-            # Function to fill "Unallocated   " slots in the timetable
-            def fill_unallocated_slots(df_timetable, section_key, section_subject_mapping, subject_dict, file_path):
-                # Load Target Subjects from Excel file
-                df_target_subjects = pd.read_excel(file_path, sheet_name="Target Subjects")
-        
-                # Ensure the column exists
-                if "Target Subjects" not in df_target_subjects.columns:
-                    raise ValueError("  'Target Subjects' column not found in the Excel file.")
-        
-                target_subjects = set(df_target_subjects["Target Subjects"])
-        
-                # Count occurrences of each subject in the current timetable
-                subject_counts = df_timetable.stack().value_counts().to_dict()
-        
-                # Ensure all subjects are included with a default count of 0
-                for subject in target_subjects:
-                    subject_counts.setdefault(subject, 0)
-        
-                # Helper function: Check if a subject is available for the current slot
-                def is_valid_assignment(subject, day):
-                    return (
-                        subject_counts[subject] < 5 and  # Ensure subject does not exceed 5 times a week
-                        (df_timetable.loc[day] == subject).sum() < 2  # Ensure subject does not repeat more than 2 times a day
-                    )
-        
-                # Fill the timetable
-                for day in df_timetable.index:
-                    for slot in df_timetable.columns:
-                        if df_timetable.at[day, slot] == "Unallocated   ":
-                            assigned = False
-        
-                            # Iterate over all section subjects
-                            for subject_id, faculty_id in section_subject_mapping.get(section_key, []):
-                                subject = subject_dict.get(subject_id, "Unknown Subject")
-        
-                                if subject == "Unknown Subject":
-                                    print(f"  Warning: Subject ID {subject_id} not found in subject_dict for {section_key}")
-        
-                                # Validate subject and assign if valid
-                                if is_valid_assignment(subject, day):
-                                    df_timetable.at[day, slot] = subject
-                                    subject_counts[subject] += 1
-                                    assigned = True
-                                    break  # Move to the next slot
-        
-                            # If no valid subject is found, assign "Free Period"
-                            if not assigned:
-                                df_timetable.at[day, slot] = "Free Period"
-        
-                return df_timetable
-        
-            # Apply the function to fill unallocated slots for each section
-            for section_key, df_timetable in timetable_dict.items():
-                timetable_dict[section_key] = fill_unallocated_slots(df_timetable, section_key, section_subject_mapping, subject_dict, file_path)
-        
-            # Print updated timetables
-            for section_key, df_timetable in timetable_dict.items():
-                print(f"\n📅 Timetable for Section: {section_key}\n")
-                print(df_timetable)
-                print("\n" + "=" * 50 + "\n")
-        
-                # Save the updated timetable in the dictionary
-                timetable_dict[section_key] = df_timetable
-        
-            # Combine all section timetables into one HTML output
-            timetable_html = ""
-            for section_key, df_timetable in timetable_dict.items():
-                timetable_html += f"<h2>Timetable for {section_key}</h2>\n"
-                timetable_html += df_timetable.to_html(classes="table table-bordered") + "<br><br>"
-            
-            return timetable_html
-
-        
-        else:
-            return "<p>No feasible solution found.</p>"
-        
-    except Exception as e:
-        return f"<p>Error: {str(e)}</p>"
 # HTML Frontend Code
 HTML_CODE = """
 
@@ -677,11 +318,76 @@ HTML_CODE = """
         <h2>Upload Timetable File</h2>
         <form action="/upload" method="post" enctype="multipart/form-data">
             <input type="file" name="file" class="form-control" required>
+            <details class="mt-2">
+                <summary>Solver settings</summary>
+                <div class="row g-2 mt-1">
+                    <div class="col"><label class="form-label">Time limit (s)</label><input type="number" name="max_time" min="1" step="1" class="form-control" placeholder="{{ settings.max_time }}"></div>
+                    <div class="col"><label class="form-label">Workers</label><input type="number" name="num_workers" min="0" class="form-control" placeholder="{{ settings.num_workers }}"></div>
+                    <div class="col"><label class="form-label">Relative gap</label><input type="number" name="relative_gap" min="0" step="0.01" class="form-control" placeholder="{{ settings.relative_gap }}"></div>
+                    <div class="col"><label class="form-label">Random seed</label><input type="number" name="random_seed" class="form-control" placeholder="{{ settings.random_seed }}"></div>
+                    <div class="col"><label class="form-label">Decompose</label>
+                        <select name="decompose" class="form-select">
+                            <option value="" selected>Default ({{ 'on' if settings.decompose else 'off' }})</option>
+                            <option value="true">Solve independent parts in parallel</option>
+                            <option value="false">Single model</option>
+                        </select>
+                    </div>
+                    <div class="col"><label class="form-label">Faculty clashes</label>
+                        <select name="faculty_mode" class="form-select">
+                            <option value="" selected>Default ({{ settings.faculty_mode }})</option>
+                            <option value="soft">Penalise</option>
+                            <option value="hard">Forbid</option>
+                        </select>
+                    </div>
+                    <div class="col"><label class="form-label">Reproducible</label>
+                        <select name="deterministic" class="form-select">
+                            <option value="" selected>Default ({{ 'yes' if settings.deterministic else 'no' }})</option>
+                            <option value="true">Yes (same seed, same timetable)</option>
+                            <option value="false">No</option>
+                        </select>
+                    </div>
+                    <div class="col"><label class="form-label">On timeout</label>
+                        <select name="return_best_feasible" class="form-select">
+                            <option value="" selected>Default ({{ 'return best found' if settings.return_best_feasible else 'report failure' }})</option>
+                            <option value="true">Return best found</option>
+                            <option value="false">Report failure</option>
+                        </select>
+                    </div>
+                    <div class="col"><label class="form-label">If infeasible</label>
+                        <select name="explain" class="form-select">
+                            <option value="" selected>Default ({{ 'explain' if settings.explain else 'report only' }})</option>
+                            <option value="true">Find the conflicting requirements</option>
+                            <option value="false">Report only</option>
+                        </select>
+                    </div>
+                </div>
+                <div class="row g-2 mt-1">
+                    <div class="col"><label class="form-label">Gap weight</label><input type="number" name="gap_weight" min="0" class="form-control" placeholder="{{ settings.gap_weight }}"></div>
+                    <div class="col"><label class="form-label">Spread weight</label><input type="number" name="spread_weight" min="0" class="form-control" placeholder="{{ settings.spread_weight }}"></div>
+                    <div class="col"><label class="form-label">Free period weight</label><input type="number" name="free_weight" min="0" class="form-control" placeholder="{{ settings.free_weight }}"></div>
+                    <div class="col"><label class="form-label">Daily load weight</label><input type="number" name="load_weight" min="0" class="form-control" placeholder="{{ settings.load_weight }}"></div>
+                    <div class="col"><label class="form-label">Max periods a teacher day</label><input type="number" name="max_daily_load" min="1" class="form-control" placeholder="{{ settings.max_daily_load }}"></div>
+                </div>
+            </details>
             <br>
             <button type="submit" class="myButton">Generate Timetable</button>
         </form>
+        <h2>Batch of Workbooks</h2>
+        <form action="/batch" method="post" enctype="multipart/form-data">
+            <input type="file" name="files" accept=".xlsx,.zip" multiple class="form-control" required>
+            <div class="form-check mt-2">
+                <input class="form-check-input" type="checkbox" name="share_faculty" value="true" id="share-faculty">
+                <label class="form-check-label" for="share-faculty">Departments share faculty (never double-book a teacher across workbooks)</label>
+            </div>
+            <br>
+            <button type="submit" class="myButton">Generate All Timetables</button>
+        </form>
         <hr>
-        <div>{{ timetable|safe }}</div>
+        <div id="job-status" class="text-muted">{{ job_message }}</div>
+        {% if job_id %}
+        <button id="stop-job" type="button" class="btn btn-outline-secondary btn-sm mt-2" hidden>Stop and keep best timetable</button>
+        {% endif %}
+        <div id="timetable">{{ timetable|safe }}</div>
 
     </div>
 
@@ -694,6 +400,92 @@ HTML_CODE = """
         }
     </script>
 
+    {% if job_id %}
+    <script>
+        // Follow the background solve job: improving timetables are shown as
+        // the solver finds them, the final one replaces them when it is done
+        (function followJob() {
+            let status = document.getElementById("job-status");
+            let timetable = document.getElementById("timetable");
+            let stop = document.getElementById("stop-job");
+            let events = new EventSource("/jobs/{{ job_id }}/events");
+
+            function showProgress(job) {
+                let stage = job.progress ? job.progress.stage : job.status;
+                stop.hidden = false;
+                if (!stop.disabled) {
+                    status.textContent = "Generating timetable (" + stage + ")...";
+                }
+            }
+            function showSolution(solution) {
+                if (!stop.disabled) {
+                    status.textContent = "Best so far after " + solution.elapsed + "s: objective " +
+                        solution.objective + " (bound " + solution.bound + "), still improving...";
+                }
+            }
+            function finish(job) {
+                stop.hidden = true;
+                if (job.status === "failed") {
+                    status.textContent = "Error: " + job.error;
+                    return;
+                }
+                status.textContent = "";
+                fetch("/jobs/{{ job_id }}/result")
+                    .then(response => response.text())
+                    .then(html => { timetable.innerHTML = html; });
+            }
+
+            events.addEventListener("progress", e => showProgress(JSON.parse(e.data)));
+            events.addEventListener("solution", e => {
+                let solution = JSON.parse(e.data);
+                showSolution(solution);
+                timetable.innerHTML = solution.html;
+            });
+            events.addEventListener("done", e => {
+                events.close();
+                finish(JSON.parse(e.data));
+            });
+
+            // Past the server's cap on open streams the request is refused
+            // and the page polls the job instead, without live timetables
+            events.addEventListener("error", () => {
+                if (events.readyState !== EventSource.CLOSED) return;
+                (function poll() {
+                    fetch("/jobs/{{ job_id }}")
+                        .then(response => response.json())
+                        .then(job => {
+                            if (job.status === "finished" || job.status === "failed") {
+                                finish(job);
+                                return;
+                            }
+                            showProgress(job);
+                            if (job.solution) showSolution(job.solution);
+                            setTimeout(poll, {{ (config.EVENTS_FALLBACK_POLL * 1000)|int }});
+                        });
+                })();
+            });
+
+            stop.addEventListener("click", () => {
+                stop.disabled = true;
+                status.textContent = "Stopping, keeping the best timetable found so far...";
+                fetch("/jobs/{{ job_id }}/stop", {method: "POST"});
+            });
+        })();
+    </script>
+    {% endif %}
+
+    <script>
+        // Timetable pages and sections load in place
+        document.getElementById("timetable").addEventListener("click", e => {
+            let link = e.target.closest("a[data-fragment]");
+            if (!link) return;
+            e.preventDefault();
+            fetch(link.href)
+                .then(response => response.text())
+                .then(html => { document.getElementById("timetable").innerHTML = html; });
+        });
+    </script>
+
     <script>
         // Sticky Navbar Effect on Scroll
         window.addEventListener('scroll', function() {
@@ -714,13 +506,62 @@ HTML_CODE = """
 
 """
 
+# The page is a named template so Jinja compiles it once, on first render
+app.jinja_loader = DictLoader({"index.html": HTML_CODE})
+
+def render_page(**context):
+    return render_template("index.html", settings=app.config["SOLVER_SETTINGS"], **context)
+
 @app.route("/", methods=["GET"])
 def home():
-    return render_template_string(HTML_CODE, timetable="")
+    return render_page(timetable="")
 
 @app.route("/download")
 def download():
-    return send_file(SAMPLE_DATASET_PATH, as_attachment=True)
+    path = app.config['SAMPLE_DATASET_PATH']
+    if path and os.path.isfile(path):
+        return send_file(path, as_attachment=True)
+    from synthetic import write_workbook  # pandas, only when a sample is generated
+
+    out = io.BytesIO()
+    write_workbook(out, sections=6, labs=1, part_time=0.25)
+    out.seek(0)
+    return send_file(out, as_attachment=True, download_name="sample_timetable.xlsx",
+                     mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+# A job of this process, or a finished one from the persistent store
+def find_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None and result_store is not None:
+        job = result_store.job(job_id)
+    return job
+
+# API clients get JSON, browsers get the HTML page
+def wants_json():
+    return request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json"
+
+# Errors of the upload routes, as JSON or on the page
+def upload_error(message, code=400):
+    if wants_json():
+        return jsonify(error=message), code
+    return render_page(timetable=f"<p>Error: {escape(message)}</p>"), code
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    limit = request.max_content_length
+    return upload_error(f"The upload is larger than the {limit / (1024 * 1024):.1f} MB allowed", 413)
+
+# Delete unused uploads (see UPLOAD_MAX_AGE) at most once an interval
+last_sweep = 0.0
+
+def sweep_uploads():
+    global last_sweep
+    max_age = app.config['UPLOAD_MAX_AGE']
+    if max_age and time.time() - last_sweep >= app.config['UPLOAD_SWEEP_INTERVAL']:
+        last_sweep = time.time()
+        removed = prune_uploads(app.config['UPLOAD_FOLDER'], max_age)
+        if removed:
+            logging.getLogger(__name__).info("Removed %d unused uploads", removed)
 
 @app.route("/upload", methods=["POST"])
 def upload_file():
@@ -732,16 +573,425 @@ def upload_file():
         return redirect(url_for("home"))
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        file.save(file_path)
-
-        timetable = generate_timetable(file_path)
-        return render_template_string(HTML_CODE, timetable=timetable)
+        # A workbook without the required sheets is refused before anything
+        # is stored or queued
+        try:
+            settings = settings_from_request(request.values, app.config["SOLVER_SETTINGS"])
+            check_sheets(file.stream)
+        except ValueError as e:
+            return upload_error(str(e))
+        sweep_uploads()
+
+        workbook_hash = upload_digest(file)
+        key = cache_key(workbook_hash, settings.as_dict())
+
+        # A stored timetable for the same workbook and settings is reused as is
+        stored_id = result_store.find(workbook_hash, settings.as_dict()) if result_store is not None else None
+        if stored_id is not None:
+            job_id, cached = stored_id, result_store.job(stored_id)["result"]
+        else:
+            cached = result_cache.get(key) if result_cache is not None else None
+            job_id = job_manager.add_result(cached) if cached is not None else None
+        if cached is not None:
+            if wants_json():
+                return jsonify(job_id=job_id, status_url=url_for("job_status", job_id=job_id),
+                               result_url=url_for("job_result", job_id=job_id), cached=True), 200
+            return render_page(timetable=result_fragment(job_id, cached))
+
+        # Uploads are stored by content hash, so identical workbooks share a file
+        _, file_path = store_upload(file, app.config["UPLOAD_FOLDER"], workbook_hash)
+
+        # Only real timetables are cached, never errors or solves stopped early
+        def cache_result(result):
+            record_job(result)
+            stopped = result.get("solver", {}).get("stats", {}).get("stopped")
+            if result_cache is not None and result["status"] == "solved" and not stopped:
+                result_cache.put(key, result)
+
+        # Queue the solve and return straight away; the page polls /jobs/<id>
+        try:
+            job_id = job_manager.submit("timetable:generate_timetable", file_path, settings, on_result=cache_result)
+        except QueueFullError as e:
+            if wants_json():
+                return jsonify(error=str(e)), 503, {"Retry-After": "30"}
+            return render_page(timetable=f"<p>Error: {escape(str(e))}</p>"), 503
+
+        if wants_json():
+            return jsonify(job_id=job_id, status_url=url_for("job_status", job_id=job_id),
+                           result_url=url_for("job_result", job_id=job_id)), 202
+        return render_page(timetable="", job_id=job_id, job_message="Timetable job queued...")
 
     return redirect(url_for("home"))
 
+# Several workbooks in one job: a zip of them and/or several files. With
+# share_faculty, departments sharing a teacher never book them twice.
+@app.route("/batch", methods=["POST"])
+def batch_upload():
+    request.max_content_length = app.config["BATCH_MAX_UPLOAD_BYTES"]  # before the body is read
+    try:
+        settings = settings_from_request(request.values, app.config["SOLVER_SETTINGS"])
+    except ValueError as e:
+        return upload_error(str(e))
+    share_faculty = request.values.get("share_faculty", "").strip().lower() in ("1", "true", "yes", "on")
+    limit = app.config["BATCH_MAX_WORKBOOKS"]
+
+    # Every workbook is checked before the batch is queued; one missing a
+    # required sheet fails the whole upload
+    def store(name, stream, digest=None):
+        try:
+            check_sheets(stream)
+        except ValueError as e:
+            raise BatchError(f"{name}: {e}") from e
+        workbooks.append((name, store_upload(stream, app.config["UPLOAD_FOLDER"], digest)[1]))
+
+    sweep_uploads()
+    workbooks = []
+    try:
+        for file in request.files.getlist("files") + request.files.getlist("file"):
+            if file.filename.lower().endswith(".zip"):
+                for name, member in zip_workbooks(file.stream, limit, app.config["BATCH_MAX_BYTES"]):
+                    store(name, member)
+            elif allowed_file(file.filename):
+                store(file.filename, file.stream, upload_digest(file))
+            if len(workbooks) > limit:
+                raise BatchError(f"At most {limit} workbooks can be solved in one batch")
+    except BatchError as e:
+        return upload_error(str(e))
+    if not workbooks:
+        return upload_error("No .xlsx workbooks found in the upload")
 
+    try:
+        job_id = job_manager.submit("batch:solve_batch", workbooks, settings, share_faculty, on_result=record_job)
+    except QueueFullError as e:
+        if wants_json():
+            return jsonify(error=str(e)), 503, {"Retry-After": "30"}
+        return render_page(timetable=f"<p>Error: {escape(str(e))}</p>"), 503
+
+    if wants_json():
+        return jsonify(job_id=job_id, workbooks=len(workbooks), status_url=url_for("job_status", job_id=job_id),
+                       result_url=url_for("job_result", job_id=job_id),
+                       archive_url=url_for("job_archive", job_id=job_id)), 202
+    return render_page(timetable="", job_id=job_id, job_message=f"Batch of {len(workbooks)} workbooks queued...")
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = find_job(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    result = job.pop("result")
+    if result is not None:
+        job["result_status"] = result["status"]
+        job["solver"] = result.get("solver")
+        job["metrics"] = result.get("metrics")
+        if result.get("conflicts"):
+            job["conflicts"] = result["conflicts"]
+    if job["solution"] is not None:
+        job["solution"] = {k: v for k, v in job["solution"].items() if k != "html"}
+    return jsonify(job)
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# Server-Sent Events for one job: "progress" on every stage change,
+# "solution" with each improving timetable, then "done"
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    if find_job(job_id) is None:
+        return jsonify(error="Unknown job"), 404
+    # Each open stream holds a web thread until its job ends, so only
+    # EVENTS_MAX_STREAMS may be open at once; past that the page polls
+    if not event_streams.acquire(blocking=False):
+        return jsonify(error="Too many open event streams; poll /jobs/<id> instead"), 503, {"Retry-After": "5"}
+    poll, keepalive = app.config["EVENTS_POLL_INTERVAL"], app.config["EVENTS_KEEPALIVE"]
+
+    def stream():
+        seen, solution_seen, last_sent = None, None, time.monotonic()
+        while True:
+            job = find_job(job_id)
+            if job is None:
+                return
+            if job["status"] in (FINISHED, FAILED):
+                result = job["result"] or {}
+                yield sse("done", {"status": job["status"], "result_status": result.get("status"),
+                                   "error": job["error"]})
+                return
+            if job["updates"] != seen:
+                seen = job["updates"]
+                yield sse("progress", {"status": job["status"], "progress": job["progress"]})
+                solution = job["solution"]
+                if solution is not None and solution["solutions"] != solution_seen:
+                    solution_seen = solution["solutions"]
+                    yield sse("solution", solution)
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > keepalive:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(poll)
+
+    response = Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(event_streams.release)
+    return response
+
+# Stop a job early: a running solve keeps the best timetable found so far
+@app.route("/jobs/<job_id>/stop", methods=["POST"])
+def job_stop(job_id):
+    if find_job(job_id) is None:
+        return jsonify(error="Unknown job"), 404
+    if not job_manager.stop(job_id):
+        return jsonify(error="Job has already finished"), 409
+    return jsonify(job_id=job_id, stopping=True), 202
+
+# HTML for a finished job: the solver summary, export links and one page of
+# sections (or a single section) of the timetable
+def result_fragment(job_id, result, page=1, per_page=None, section=None):
+    if result.get("batch") is not None:
+        link = lambda entry: (f'<a data-fragment href="{url_for("job_result", job_id=entry["job_id"])}">View</a>'
+                              if entry.get("job_id") else "")
+        archive = url_for("job_archive", job_id=job_id)
+        return batch_html(result["batch"], link) + f'<p class="small">Download: <a href="{archive}">All timetables (zip)</a></p>'
+    timetable = result.get("timetable")
+    if timetable is None:
+        return result["html"]
+    exports = " &middot; ".join(
+        f'<a href="{url_for(f"job_timetable_{kind}", job_id=job_id)}">{kind.upper()}</a>'
+        for kind in ("xlsx", "csv", "json"))
+    views = " &middot; ".join(
+        f'<a data-fragment href="{url_for("job_view_index", job_id=job_id, view=view)}">{view.capitalize()}</a>'
+        for view in VIEWS)
+    html = result["html"] + f'<p class="small">Download: {exports} &middot; Weekly views: {views}</p>'
+    if section is not None:
+        back = url_for("job_result", job_id=job_id, per_page=per_page)
+        return html + f'<p class="small"><a data-fragment href="{back}">All sections</a></p>' + timetable.section_html(section)
+    page_url = lambda **args: url_for("job_result", job_id=job_id, per_page=per_page, **args)
+    return html + timetable.page_html(page, per_page or app.config["RESULT_PAGE_SIZE"], page_url)
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = find_job(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    if job["status"] == FAILED:
+        return f"<p>Error: {escape(job['error'])}</p>", 500
+    if job["status"] != FINISHED:
+        return jsonify(status=job["status"], progress=job["progress"]), 202
+    result = job["result"]
+    section = request.args.get("section")
+    if section is not None and (result.get("timetable") is None or section not in result["timetable"].sections):
+        return jsonify(error="Unknown section"), 404
+    page = request.args.get("page", 1, type=int)
+    per_page = request.args.get("per_page", type=int)
+    if per_page is not None:
+        per_page = max(1, per_page)
+    return result_fragment(job_id, result, page, per_page, section)
+
+# One folder per workbook of a batch job: its timetable as XLSX and CSV, or
+# the result message when it was not solved; summary.csv lists them all
+@app.route("/jobs/<job_id>/archive.zip")
+def job_archive(job_id):
+    job = find_job(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    if job["status"] == FAILED:
+        return jsonify(error=job["error"]), 500
+    if job["status"] != FINISHED:
+        return jsonify(status=job["status"], progress=job["progress"]), 202
+    entries = job["result"].get("batch")
+    if entries is None:
+        return jsonify(error="Not a batch job"), 409
+
+    out = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    used = set()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        summary = io.StringIO()
+        writer = csv.writer(summary)
+        writer.writerow(["workbook", "folder", "status", "job_id"])
+        for entry in entries:
+            folder = base = os.path.splitext(entry["name"])[0] or "workbook"
+            n = 1
+            while folder in used:
+                n += 1
+                folder = f"{base}-{n}"
+            used.add(folder)
+            writer.writerow([entry["name"], folder, entry["status"], entry.get("job_id") or ""])
+            workbook_job = find_job(entry["job_id"]) if entry.get("job_id") else None
+            result = workbook_job["result"] if workbook_job is not None else None
+            if result is not None and result.get("timetable") is not None:
+                xlsx = io.BytesIO()
+                result["timetable"].write_xlsx(xlsx)
+                archive.writestr(f"{folder}/timetable.xlsx", xlsx.getvalue())
+                archive.writestr(f"{folder}/timetable.csv", "".join(result["timetable"].iter_csv()))
+            elif result is not None:
+                archive.writestr(f"{folder}/result.html", result["html"])
+        archive.writestr("summary.csv", summary.getvalue())
+    out.seek(0)
+    return send_file(out, as_attachment=True, download_name=f"timetables-{job_id[:8]}.zip",
+                     mimetype="application/zip")
+
+# The structured timetable of a solved job, or an error response
+def solved_timetable(job_id):
+    job = find_job(job_id)
+    if job is None:
+        return None, (jsonify(error="Unknown job"), 404)
+    if job["status"] == FAILED:
+        return None, (jsonify(error=job["error"]), 500)
+    if job["status"] != FINISHED:
+        return None, (jsonify(status=job["status"], progress=job["progress"]), 202)
+    if job["result"].get("timetable") is None:
+        return None, (jsonify(error=f"No timetable: the job result is {job['result']['status']}"), 409)
+    return job["result"], None
+
+@app.route("/jobs/<job_id>/timetable.json")
+def job_timetable_json(job_id):
+    result, error = solved_timetable(job_id)
+    if error:
+        return error
+    return jsonify(status=result["status"], solver=result["solver"], timetable=result["timetable"].to_dict())
+
+# One row per (section, day, slot) cell
+@app.route("/jobs/<job_id>/timetable.csv")
+def job_timetable_csv(job_id):
+    result, error = solved_timetable(job_id)
+    if error:
+        return error
+    return Response(result["timetable"].iter_csv(), mimetype="text/csv",
+                    headers={"Content-Disposition": f"attachment; filename=timetable-{job_id[:8]}.csv"})
+
+# One sheet per section
+@app.route("/jobs/<job_id>/timetable.xlsx")
+def job_timetable_xlsx(job_id):
+    result, error = solved_timetable(job_id)
+    if error:
+        return error
+    out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    result["timetable"].write_xlsx(out)
+    out.seek(0)
+    return send_file(out, as_attachment=True, download_name=f"timetable-{job_id[:8]}.xlsx",
+                     mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+# Re-solve a finished job after a small edit (blocked slots, faculty swaps,
+# extra fixed activities), warm-started from its timetable. JSON body:
+# {"blocked_slots": [...], "swap_faculty": [...], "fixed_activities": [...], "settings": {...}}
+@app.route("/jobs/<job_id>/resolve", methods=["POST"])
+def job_resolve(job_id):
+    job = find_job(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    result = job["result"]
+    if job["status"] != FINISHED or result["status"] != "solved" or not result.get("assignment"):
+        return jsonify(error="Only solved timetables can be re-solved"), 409
+
+    payload = request.get_json(silent=True)
+    try:
+        delta = parse_delta(payload)
+        settings = settings_from_request((payload or {}).get("settings") or {}, app.config["SOLVER_SETTINGS"])
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    # Edits accumulate: the workbook on disk is always the original upload,
+    # marked as used so the upload sweep keeps it
+    try:
+        os.utime(result["workbook"])
+    except OSError:
+        return jsonify(error="The workbook of this timetable is no longer kept; upload it again"), 410
+    delta = combine_deltas(result.get("delta"), delta)
+    try:
+        new_job_id = job_manager.submit("incremental:resolve_timetable", result["workbook"], result["assignment"],
+                                        delta, settings, on_result=record_job)
+    except QueueFullError as e:
+        return jsonify(error=str(e)), 503, {"Retry-After": "30"}
+    return jsonify(job_id=new_job_id, status_url=url_for("job_status", job_id=new_job_id),
+                   result_url=url_for("job_result", job_id=new_job_id)), 202
+
+# Weekly views across sections: every faculty member's or lab's classes,
+# served from the result's index. /jobs/<id>/faculty lists the faculty,
+# /jobs/<id>/faculty/<faculty_id>?day=Tuesday is one teacher's grid.
+VIEWS = {"faculty": "faculty", "labs": "lab"}
+
+@app.route("/jobs/<job_id>/<any(faculty, labs):view>")
+def job_view_index(job_id, view):
+    result, error = solved_timetable(job_id)
+    if error:
+        return error
+    timetable = result["timetable"]
+    index = timetable.index(VIEWS[view])
+    names = timetable.index("lab_names") if view == "labs" else {}
+    keys = sorted(index)
+    if wants_json():
+        return jsonify({view: [{"id": key, "name": names.get(key, key), "periods": len(index[key])} for key in keys]})
+    return '<p class="small">' + " &middot; ".join(
+        f'<a data-fragment href="{url_for("job_view", job_id=job_id, view=view, key=key)}">{escape(names.get(key, key))}</a>'
+        for key in keys) + "</p>"
+
+@app.route("/jobs/<job_id>/<any(faculty, labs):view>/<key>")
+def job_view(job_id, view, key):
+    result, error = solved_timetable(job_id)
+    if error:
+        return error
+    timetable = result["timetable"]
+    if key not in timetable.index(VIEWS[view]):
+        return jsonify(error=f"No classes for {key!r} in this timetable"), 404
+    day = request.args.get("day")
+    if day is not None and day not in timetable.days:
+        return jsonify(error=f"Unknown day {day!r}"), 404
+    days = [day] if day else None
+    if wants_json():
+        rows = timetable.schedule(VIEWS[view], key, days)
+        return jsonify(view=view, id=key, slots=timetable.slots,
+                       days=[{"day": d, "slots": [[{"section": section, "label": label} for section, label in entries]
+                                                  for entries in row]} for d, row in rows.items()])
+    back = url_for("job_result", job_id=job_id)
+    return (f'<p class="small"><a data-fragment href="{back}">All sections</a></p>'
+            + timetable.schedule_html(VIEWS[view], key, days))
+
+# Timetable cells of a solved job filtered by ?section=, ?faculty= and ?day=
+@app.route("/jobs/<job_id>/cells")
+def job_cells(job_id):
+    filters = {name: request.args.get(name) for name in ("section", "faculty", "day")}
+    cells = result_store.cells(job_id, **filters) if result_store is not None else None
+    if cells is not None:
+        return jsonify(cells=cells)
+    result, error = solved_timetable(job_id)
+    if error:
+        return error
+    columns = {"section": "section", "faculty": "faculty_id", "day": "day"}
+    cells = [cell for cell in result["timetable"].records()
+             if all(value is None or cell[columns[name]] == value for name, value in filters.items())]
+    return jsonify(cells=cells)
+
+@app.route("/jobs")
+def job_queue():
+    stats = job_manager.stats()
+    if result_cache is not None:
+        stats["cache"] = result_cache.stats()
+    if result_store is not None:
+        stats["store"] = result_store.stats()
+    return jsonify(stats)
+
+
+# Liveness for load balancers and process managers: no store, cache or solver
+@app.route("/healthz")
+def healthz():
+    return jsonify(status="ok")
+
+# Prometheus scrape endpoint: stage timings, model sizes and solver stats of
+# finished jobs, plus the current job queue, cache and store
+@app.route("/metrics")
+def metrics():
+    jobs = job_manager.stats()
+    sampled = {
+        "timetable_jobs": ("gauge", [({"state": state}, jobs[state])
+                                     for state in ("queued", "running", "finished", "failed")]),
+        "timetable_job_slots": ("gauge", [({}, jobs["max_workers"] + jobs["max_queue"])]),
+    }
+    if result_cache is not None:
+        cache = result_cache.stats()
+        sampled["timetable_cache_entries"] = ("gauge", [({}, cache["entries"])])
+        sampled["timetable_cache_requests_total"] = (
+            "counter", [({"outcome": "hit"}, cache["hits"]), ({"outcome": "miss"}, cache["misses"])])
+    if result_store is not None:
+        sampled["timetable_store_results"] = ("gauge", [({}, result_store.stats()["results"])])
+    return Response(REGISTRY.render(sampled), mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     app.run(port=1000, debug=False)
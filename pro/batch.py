@@ -0,0 +1,148 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from batch_upload import batch_html
+from decompose import connected_groups
+from loader import WorkbookError, load_timetable_data
+from metrics import collecting, merge, span
+from model_builder import prepare_problem
+from settings import SolverSettings
+from solver import STOP_POLL_INTERVAL
+from timetable import ComponentProgress, generate_timetable
+
+logger = logging.getLogger(__name__)
+
+# Result statuses from worst to best; a batch has the worst of its workbooks
+STATUS_ORDER = ("error", "infeasible", "timeout", "solved")
+
+
+# Faculty IDs (as text) teaching any class of a workbook; an unreadable
+# workbook has none and is solved, and fails, on its own
+def workbook_faculty(path):
+    try:
+        problem = prepare_problem(load_timetable_data(path))
+    except WorkbookError:
+        return set()
+    return {str(faculty_id)
+            for mapping in (problem.section_subject_mapping, problem.section_lab_mapping)
+            for entries in mapping.values() for _, faculty_id in entries if faculty_id}
+
+
+# prepare() hook blocking the periods other workbooks already gave a teacher
+def block_taught(taught):
+    def prepare(problem):
+        for mapping in (problem.section_subject_mapping, problem.section_lab_mapping):
+            for entries in mapping.values():
+                for _, faculty_id in entries:
+                    if faculty_id and str(faculty_id) in taught:
+                        problem.faculty_blocked.setdefault(faculty_id, set()).update(taught[str(faculty_id)])
+
+    return prepare
+
+
+# Workbooks sharing faculty, solved one after another: each one sees the
+# periods its teachers were given by the earlier ones as unavailable. Once
+# stop() is set the running solve keeps its best timetable and the rest of
+# the chain is left unsolved.
+def _solve_linked(paths, settings, stop):
+    taught = {}  # faculty ID as text -> {(day, slot)}
+    results = []
+    for i, path in enumerate(paths):
+        if stop():
+            break
+        progress = ComponentProgress(i, None, stop, 0)
+        result = generate_timetable(path, settings, progress=progress, prepare=block_taught(taught))
+        if taught and result.get("solver"):
+            # Not the timetable the workbook gets on its own (see ResultStore.find)
+            result["solver"]["stats"]["shared_faculty"] = True
+        timetable = result.get("timetable")
+        if timetable is not None:
+            for _, day, slot, _, kind, _, faculty_id, *_ in timetable.cells:
+                if faculty_id and kind in ("theory", "lab"):
+                    taught.setdefault(str(faculty_id), set()).add((day, slot))
+        results.append(result)
+    return results
+
+
+# Stop flag shared with the processes solving groups (set by _init_group)
+_group_stop = None
+
+
+def _init_group(stop):
+    global _group_stop
+    _group_stop = stop
+
+
+def _solve_group(paths, settings):
+    return _solve_linked(paths, settings, _group_stop.is_set)
+
+
+# Solve several workbooks as one job. Without share_faculty every workbook
+# is independent; with it, workbooks that share a teacher are chained (see
+# _solve_linked) so no teacher is booked twice across departments. Groups
+# run side by side on a process pool that splits the solver worker budget.
+# workbooks is a list of (name, path).
+def solve_batch(workbooks, settings=None, share_faculty=False, progress=None):
+    if progress is None:
+        progress = lambda stage, fraction=None, **info: None
+    if settings is None:
+        settings = SolverSettings()
+    stop_requested = getattr(progress, "stop_requested", None) or (lambda: False)
+    paths = [path for _, path in workbooks]
+    with collecting() as collected:
+        progress("loading", 0.05, workbooks=len(workbooks))
+        positions = list(range(len(workbooks)))
+        if share_faculty:
+            with span("parse"):
+                faculty = [workbook_faculty(path) for path in paths]
+            groups = connected_groups(positions, lambda i: faculty[i])
+        else:
+            groups = [[i] for i in positions]
+
+        processes, group_settings = settings.split(len(groups))
+        results = [None] * len(workbooks)
+        done = 0
+
+        def finished(group, group_results):
+            nonlocal done
+            for i, result in zip(group, group_results):
+                merge(result.get("metrics"))
+                results[i] = result
+            done += len(group_results)
+            progress("solving", 0.1 + 0.85 * done / len(workbooks), solved=done, workbooks=len(workbooks))
+
+        progress("solving", 0.1, solved=0, workbooks=len(workbooks))
+        if processes == 1:
+            for group in groups:
+                if stop_requested():
+                    break
+                finished(group, _solve_linked([paths[i] for i in group], group_settings, stop_requested))
+        else:
+            # A stop request reaches the running solves through the shared
+            # event; groups not started yet are cancelled
+            ctx = multiprocessing.get_context()
+            stop = ctx.Event()
+            with ProcessPoolExecutor(max_workers=processes, mp_context=ctx, initializer=_init_group,
+                                     initargs=(stop,)) as pool:
+                pending = {pool.submit(_solve_group, [paths[i] for i in group], group_settings): group
+                           for group in groups}
+                while pending:
+                    completed, _ = wait(pending, timeout=STOP_POLL_INTERVAL)
+                    for future in completed:
+                        group = pending.pop(future)
+                        if not future.cancelled():
+                            finished(group, future.result())
+                    if not stop.is_set() and stop_requested():
+                        stop.set()
+                        for future in pending:
+                            future.cancel()
+
+    results = [result if result is not None else {"status": "error", "html": "<p>Stopped before it was solved.</p>"}
+               for result in results]
+    entries = [{"name": name, "status": result["status"]} for (name, _), result in zip(workbooks, results)]
+    status = min((entry["status"] for entry in entries), key=STATUS_ORDER.index, default="solved")
+    logger.info("Batch of %d workbooks: %s (%s)", len(workbooks), status,
+                ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in collected["spans"].items()))
+    return {"status": status, "html": batch_html(entries), "batch": entries, "results": results,
+            "share_faculty": share_faculty, "metrics": collected}
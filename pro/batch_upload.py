@@ -0,0 +1,45 @@
+import os
+import zipfile
+from html import escape
+
+# The web side of batch jobs: reading the uploaded workbooks and the summary
+# table. Kept apart from batch.py, which solves them, so the web tier loads
+# no solver code.
+
+
+class BatchError(ValueError):
+    pass
+
+
+# Workbooks inside a zip: (file name, binary stream) for every .xlsx member,
+# skipping folders, hidden files, Excel lock files and macOS metadata.
+# Member count and total unpacked size are checked before anything is read.
+def zip_workbooks(stream, max_workbooks, max_bytes):
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile as e:
+        raise BatchError(f"Could not read zip: {e}") from e
+    members = []
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if info.is_dir() or info.filename.startswith("__MACOSX/") or name.startswith((".", "~$")):
+            continue
+        if name.lower().endswith(".xlsx"):
+            members.append(info)
+    if len(members) > max_workbooks:
+        raise BatchError(f"The zip holds {len(members)} workbooks; at most {max_workbooks} are allowed")
+    if sum(info.file_size for info in members) > max_bytes:
+        raise BatchError(f"The workbooks in the zip unpack to more than {max_bytes} bytes")
+    for info in members:
+        with archive.open(info) as member:
+            yield os.path.basename(info.filename), member
+
+
+def batch_html(entries, link=None):
+    rows = "".join(
+        f"<tr><td>{escape(entry['name'])}</td><td>{escape(entry['status'])}</td>"
+        f"<td>{link(entry) if link else ''}</td></tr>"
+        for entry in entries)
+    solved = sum(entry["status"] == "solved" for entry in entries)
+    return (f"<p>{solved} of {len(entries)} workbooks solved.</p>"
+            f'<table class="table table-bordered"><tr><th>Workbook</th><th>Status</th><th></th></tr>{rows}</table>')
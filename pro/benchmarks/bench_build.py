@@ -0,0 +1,213 @@
+# Model build time: the pre-index, scan-based construction vs the indexed
+# one, both building the same model (build_core(), soft faculty clashes and
+# the objective; main() stops if their variable or constraint counts differ),
+# plus build_model() with the soft constraints added.
+#
+# On one core, best of 5, --sections 16 64 128 256 takes 0.064, 0.337, 0.883
+# and 1.756s legacy vs 0.058, 0.239, 0.560 and 1.401s indexed: 1.1x, 1.4x,
+# 1.6x and 1.3x, or 12-18us per variable indexed (4982 to 78946 variables,
+# 0.6 constraints per variable). Repeated runs vary by about 0.3x either way.
+# The soft constraints add 0.03-0.6s to the indexed build.
+#
+#   cd pro && python -m benchmarks.bench_build [--sections 8 16 32 64]
+import argparse
+import contextlib
+import io
+import time
+
+from ortools.sat.python import cp_model
+
+from synthetic import synthetic_data
+from model_builder import (MAX_PERIODS_PER_DAY, MAX_THEORY_PER_WEEK, MIN_PERIODS_PER_WEEK, prepare_problem, build_core,
+                           add_faculty_constraints, set_objective, build_model, lab_capacity, lab_option)
+
+
+# The pre-index construction style of generate_timetable(): named vars kept
+# in dicts of lists, and every constraint family found by scanning those
+# lists for each section, day and slot. It builds what build_core() and soft
+# faculty clashes build today, so both sides make the same model.
+def legacy_build(problem):
+    model = cp_model.CpModel()
+    sections, days, all_slots = problem.sections, problem.days, problem.all_slots
+    break_slots, fixed_activities, faculty_blocked = problem.break_slots, problem.fixed_activities, problem.faculty_blocked
+    section_lab_mapping, section_subject_mapping = problem.section_lab_mapping, problem.section_subject_mapping
+    is_lab_assigned, WeeklyOnce_vars, is_subject_assigned = {}, {}, {}
+
+    def is_open(section, day, slot):
+        return slot not in break_slots and slot not in fixed_activities.get(section, {}).get(day, {})
+
+    def can_teach(section, faculty_id, day, slot):
+        return is_open(section, day, slot) and (day, slot) not in faculty_blocked.get(faculty_id, ())
+
+    def first_faculty(mapping, section):
+        subjects = {}
+        for subject_id, faculty_id in mapping.get(section, []):
+            subjects.setdefault(subject_id, faculty_id)
+        return subjects
+
+    # Labs: a var per room and run of open slots
+    for section in sections:
+        for subject_id, faculty_id in first_faculty(section_lab_mapping, section).items():
+            length, rooms = lab_option(problem, section, subject_id)
+            is_lab_assigned[(section, subject_id)] = []
+            for room in dict.fromkeys(rooms):
+                for day in days:
+                    for i in range(len(all_slots) - length + 1):
+                        slots = all_slots[i:i + length]
+                        if all(can_teach(section, faculty_id, day, slot) for slot in slots):
+                            var = model.NewBoolVar(f"lab_{section}_{subject_id}_{room}_{day}_{slots[0]}")
+                            is_lab_assigned[(section, subject_id)].append((room, day, slots, var))
+
+    rooms = dict.fromkeys(room for labs in is_lab_assigned.values() for room, _, _, _ in labs)
+    for room in rooms:
+        sessions = [(day, slots, var) for labs in is_lab_assigned.values() for r, day, slots, var in labs if r == room]
+        capacity = lab_capacity(problem, room)
+        if len(sessions) > capacity:
+            intervals = [model.NewOptionalFixedSizeIntervalVar(days.index(day) * len(all_slots) + all_slots.index(slots[0]),
+                                                               len(slots), var, f"room_{room}_{i}")
+                         for i, (day, slots, var) in enumerate(sessions)]
+            if capacity == 1:
+                model.AddNoOverlap(intervals)
+            else:
+                model.AddCumulative(intervals, [1] * len(intervals), capacity)
+
+    for section in sections:
+        for day in days:
+            lab_sessions_for_day = [var for subject_id in first_faculty(section_lab_mapping, section)
+                                    for _, d, _, var in is_lab_assigned[(section, subject_id)] if d == day]
+            if len(lab_sessions_for_day) > 1:
+                model.AddAtMostOne(lab_sessions_for_day)
+
+    for labs in is_lab_assigned.values():
+        if labs:
+            model.AddExactlyOne(var for _, _, _, var in labs)
+
+    # Weekly Once subjects: a var per open slot, exactly one of them chosen
+    for section in sections:
+        WeeklyOnce_vars[section] = {}
+        for subject_id in dict.fromkeys(problem.weekly_once_by_year.get(section.split("_")[0], [])):
+            available_slots = [(day, slot) for day in days for slot in all_slots if is_open(section, day, slot)]
+            if available_slots:
+                WeeklyOnce_vars[section][subject_id] = [
+                    (day, slot, model.NewBoolVar(f"weekly_{section}_{subject_id}_{day}_{slot}"))
+                    for day, slot in available_slots]
+                model.AddExactlyOne(var for _, _, var in WeeklyOnce_vars[section][subject_id])
+
+    # Regular subjects: a var per open slot their own lab does not cover
+    for section in sections:
+        for subject_id, faculty_id in first_faculty(section_subject_mapping, section).items():
+            own_labs = is_lab_assigned.get((section, subject_id), [])
+            covered = {(day, slot) for _, day, slots, _ in own_labs for slot in slots}
+            theory = [(day, slot, model.NewBoolVar(f"subject_{section}_{subject_id}_{day}_{slot}"))
+                      for day in days for slot in all_slots
+                      if can_teach(section, faculty_id, day, slot) and (day, slot) not in covered]
+            is_subject_assigned[(section, subject_id)] = theory
+            for day in days:
+                day_terms = ([var for d, _, var in theory if d == day]
+                             + [min(len(slots), MAX_PERIODS_PER_DAY) * var for _, d, slots, var in own_labs if d == day])
+                if day_terms:
+                    model.Add(sum(day_terms) <= MAX_PERIODS_PER_DAY)
+            if len(theory) > MAX_THEORY_PER_WEEK:
+                model.Add(sum(var for _, _, var in theory) <= MAX_THEORY_PER_WEEK)
+            assigned_vars = [var for _, _, var in theory] + [var for _, _, slots, var in own_labs for _ in slots]
+            if assigned_vars:
+                model.Add(sum(assigned_vars) >= MIN_PERIODS_PER_WEEK)
+
+    # At most one class per slot per section
+    for section in sections:
+        for day in days:
+            for slot in all_slots:
+                slot_vars = [var for subject_id in first_faculty(section_subject_mapping, section)
+                             for d, s, var in is_subject_assigned[(section, subject_id)] if d == day and s == slot]
+                slot_vars += [var for subject_id in first_faculty(section_lab_mapping, section)
+                              for _, d, slots, var in is_lab_assigned[(section, subject_id)]
+                              if d == day and slot in slots]
+                slot_vars += [var for vars_ in WeeklyOnce_vars[section].values()
+                              for d, s, var in vars_ if d == day and s == slot]
+                if len(slot_vars) > 1:
+                    model.AddAtMostOne(slot_vars)
+
+    # What each teacher teaches per slot; a lab taught by its subject's
+    # theory teacher counts once
+    teaching = {}  # (faculty_id, day, slot) -> {var index: var}
+    for day in days:
+        for slot in all_slots:
+            for section in sections:
+                for subject_id, faculty_id in first_faculty(section_subject_mapping, section).items():
+                    if faculty_id is None:
+                        continue
+                    for d, s, var in is_subject_assigned[(section, subject_id)]:
+                        if d == day and s == slot:
+                            teaching.setdefault((faculty_id, day, slot), {})[var.Index()] = var
+                    for _, d, slots, var in is_lab_assigned.get((section, subject_id), []):
+                        if d == day and slot in slots:
+                            teaching.setdefault((faculty_id, day, slot), {})[var.Index()] = var
+                for subject_id, faculty_id in first_faculty(section_lab_mapping, section).items():
+                    if faculty_id is None:
+                        continue
+                    for _, d, slots, var in is_lab_assigned[(section, subject_id)]:
+                        if d == day and slot in slots:
+                            teaching.setdefault((faculty_id, day, slot), {})[var.Index()] = var
+
+    for faculty_id, (per_day, per_week) in problem.faculty_limits.items():
+        for cap, periods in ((per_day, [[var for (f, d, _), vars_ in teaching.items() if f == faculty_id and d == day
+                                         for var in vars_.values()] for day in days]),
+                             (per_week, [[var for (f, _, _), vars_ in teaching.items() if f == faculty_id
+                                          for var in vars_.values()]])):
+            for vars_ in periods:
+                if cap is not None and cap < len(vars_):
+                    model.Add(sum(vars_) <= cap)
+
+    penalty_vars = []
+    for (faculty_id, day, slot), vars_ in teaching.items():
+        if len(vars_) > 1:
+            excess = model.NewIntVar(0, len(vars_) - 1, f"faculty_conflict_{faculty_id}_{day}_{slot}")
+            model.Add(sum(vars_.values()) - 1 <= excess)
+            penalty_vars.append(excess)
+    model.Minimize(5 * sum(penalty_vars))
+    return model
+
+
+# What legacy_build() builds: section constraints and faculty clash penalties
+def indexed_build(problem):
+    timetable_model = build_core(problem)
+    add_faculty_constraints(timetable_model, {}, "soft")
+    set_objective(timetable_model)
+    return timetable_model
+
+
+def best_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--labs", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'sections':>8} {'variables':>10} {'constraints':>11} {'legacy s':>10} {'indexed s':>10} {'speedup':>8}"
+          f" {'with soft s':>11}")
+    for n in args.sections:
+        problem = prepare_problem(synthetic_data(sections=n, labs=args.labs))
+        with contextlib.redirect_stdout(io.StringIO()):
+            sizes = {(len(model.Proto().variables), len(model.Proto().constraints))
+                     for model in (legacy_build(problem), indexed_build(problem).model)}
+        if len(sizes) > 1:
+            raise SystemExit(f"legacy and indexed models differ at {n} sections: {sorted(sizes)}")
+        (variables, constraints), = sizes
+        legacy = best_time(lambda: legacy_build(problem), args.repeat)
+        indexed = best_time(lambda: indexed_build(problem), args.repeat)
+        full = best_time(lambda: build_model(problem), args.repeat)
+        print(f"{n:>8} {variables:>10} {constraints:>11} {legacy:>10.3f} {indexed:>10.3f} {legacy / indexed:>7.1f}x"
+              f" {full:>11.3f}")
+
+if __name__ == "__main__":
+    main()
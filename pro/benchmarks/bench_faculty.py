@@ -0,0 +1,72 @@
+# Faculty-clash formulations on the same instances: the original reified
+# penalty BoolVars vs the soft excess counters and hard AtMostOne of
+# model_builder.add_faculty_constraints().
+#
+#   cd pro && python -m benchmarks.bench_faculty [--sections 16 32 64] [--max-time 30]
+import argparse
+import contextlib
+import io
+import time
+
+from ortools.sat.python.cp_model import LinearExpr
+
+from synthetic import synthetic_data
+from model_builder import prepare_problem, build_core, add_faculty_constraints, faculty_slot_groups, set_objective
+from settings import SolverSettings
+from solver import solve
+
+
+# One reified penalty BoolVar (two OnlyEnforceIf constraints) per contested faculty slot
+def add_reified_penalties(timetable_model):
+    model = timetable_model.model
+    for faculty_id, day, slot, slot_vars in faculty_slot_groups(timetable_model):
+        penalty_var = model.new_bool_var(f"faculty_conflict_{faculty_id}_{day}_{slot}")
+        model.add(LinearExpr.sum(slot_vars) > 1).only_enforce_if(penalty_var)
+        model.add(LinearExpr.sum(slot_vars) <= 1).only_enforce_if(~penalty_var)
+        timetable_model.penalty_vars.append(penalty_var)
+
+
+def build(problem, mode):
+    with contextlib.redirect_stdout(io.StringIO()):
+        timetable_model = build_core(problem)
+    if mode == "reified":
+        add_reified_penalties(timetable_model)
+    else:
+        add_faculty_constraints(timetable_model, {}, mode)
+    set_objective(timetable_model)
+    return timetable_model
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--faculty-ratio", type=float, default=0.25,
+                        help="teachers per class taught; lower means more contention")
+    # No labs by default: lab rooms add their own contention, which would
+    # hide the faculty formulation
+    parser.add_argument("--labs", type=int, default=0)
+    parser.add_argument("--max-time", type=float, default=30.0)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    settings = SolverSettings(num_workers=args.workers, max_time=args.max_time, random_seed=args.seed)
+    print(f"{'sections':>8} {'mode':>8} {'vars':>8} {'constraints':>11} {'build s':>8} "
+          f"{'solve s':>8} {'status':>10} {'objective':>9}")
+    for n in args.sections:
+        subjects, labs = 5, args.labs
+        faculty = max(2, int(n * (subjects + labs) * args.faculty_ratio))
+        problem = prepare_problem(synthetic_data(sections=n, subjects=subjects, labs=labs,
+                                                 faculty=faculty, seed=args.seed))
+        for mode in ("reified", "soft", "hard"):
+            start = time.perf_counter()
+            timetable_model = build(problem, mode)
+            build_time = time.perf_counter() - start
+            proto = timetable_model.model.Proto()
+            _, _, stats = solve(timetable_model.model, settings)
+            print(f"{n:>8} {mode:>8} {len(proto.variables):>8} {len(proto.constraints):>11} "
+                  f"{build_time:>8.3f} {stats['wall_time']:>8.3f} {stats['status']:>10} {str(stats['objective']):>9}")
+
+
+if __name__ == "__main__":
+    main()
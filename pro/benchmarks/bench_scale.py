@@ -0,0 +1,87 @@
+# End-to-end scaling of generate_timetable() on synthetic workbooks: stage
+# times (parse, prepare, presolve, build, solve, extract, render), HTML and XLSX
+# export times, model size and peak memory for each size. Every size runs in
+# a fresh process so its peak RSS is its own.
+#
+#   cd pro && python -m benchmarks.bench_scale [--sections 8 16 32 64] [--json scale.json]
+#
+# Any status but "solved" is worth a look. Long labs of theory subjects
+# (e.g. --labs 1 --lab-slots 3 --theory-labs --slots-per-day 10) must solve.
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from settings import SolverSettings
+from synthetic import write_workbook
+from timetable import generate_timetable
+
+STAGES = ("parse", "prepare", "presolve", "build", "solve", "extract", "render")
+
+
+def run_size(path, settings):
+    start = time.perf_counter()
+    result = generate_timetable(path, settings)
+    total = time.perf_counter() - start
+    row = dict(result["metrics"]["spans"], **result["metrics"]["counters"], status=result["status"], total=total)
+
+    timetable = result.get("timetable")
+    if timetable is not None:
+        start = time.perf_counter()
+        timetable.page_html(1, len(timetable.sections), lambda **args: "#")
+        row["html"] = time.perf_counter() - start
+        start = time.perf_counter()
+        timetable.write_xlsx(io.BytesIO())
+        row["xlsx"] = time.perf_counter() - start
+    row["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--subjects", type=int, default=5)
+    # No labs by default, so rows stay comparable with runs from before lab
+    # rooms (when labs shared one campus-wide pool)
+    parser.add_argument("--labs", type=int, default=0)
+    parser.add_argument("--lab-slots", type=int, default=None)
+    parser.add_argument("--theory-labs", action="store_true", help="labs share the Subject ID of a theory subject")
+    parser.add_argument("--slots-per-day", type=int, default=8)
+    parser.add_argument("--max-time", type=float, default=60.0)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the rows to this file")
+    parser.add_argument("--keep-workbooks", help="directory to keep the generated workbooks in")
+    args = parser.parse_args()
+
+    settings = SolverSettings(num_workers=args.workers, max_time=args.max_time, random_seed=args.seed)
+    directory = args.keep_workbooks or tempfile.mkdtemp(prefix="bench_scale_")
+    os.makedirs(directory, exist_ok=True)
+
+    columns = ("sections", "model_variables", "model_constraints") + STAGES + ("html", "xlsx", "total", "peak_rss_mb")
+    print(" ".join(f"{name.replace('model_', ''):>11}" for name in columns) + f" {'status':>8}")
+    rows = []
+    for n in args.sections:
+        path = os.path.join(directory, f"synthetic_{n}.xlsx")
+        write_workbook(path, sections=n, subjects=args.subjects, labs=args.labs, lab_slots=args.lab_slots,
+                       theory_labs=args.theory_labs, slots_per_day=args.slots_per_day, seed=args.seed)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as pool:
+            row = dict(pool.submit(run_size, path, settings).result(), sections=n)
+        rows.append(row)
+        print(" ".join(f"{row.get(name, ''):>11.3f}" if isinstance(row.get(name), float) else f"{row.get(name, ''):>11}"
+                       for name in columns) + f" {row['status']:>8}")
+        if not args.keep_workbooks:
+            os.remove(path)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": settings.as_dict(), "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# Startup cost of each tier, every run in a fresh interpreter: the web tier
+# (import app, then the first requests a worker serves) and the solver tier
+# a pool worker preloads (app.SOLVER_MODULES). Prints the median import time,
+# peak RSS and which heavy libraries each tier ends up loading.
+#
+#   cd pro && python -m benchmarks.bench_startup [--runs 5]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY = ("ortools", "pandas", "numpy", "openpyxl")
+
+# Run in the child: time `setup`, then report it with the peak RSS and the
+# heavy libraries now in sys.modules
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+{setup}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds,
+                  "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+TIERS = {
+    "web import": "import app",
+    "web first requests": "import app\n"
+                          "client = app.app.test_client()\n"
+                          "client.get('/healthz')\n"
+                          "client.get('/')",
+    "solver import": "import timetable, incremental, batch",
+}
+
+
+def run_tier(setup, directory):
+    pro = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=pro, RESULT_STORE_PATH=os.path.join(directory, "results.db"),
+               RESULT_CACHE_DIR=os.path.join(directory, "cache"), LOG_LEVEL="WARNING")
+    output = subprocess.run([sys.executable, "-c", CHILD.format(setup=setup, heavy=HEAVY)], cwd=directory, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'tier':>20} {'seconds':>8} {'rss_mb':>8}  loaded")
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as directory:
+        for name, setup in TIERS.items():
+            runs = [run_tier(setup, directory) for _ in range(args.runs)]
+            seconds = statistics.median(run["seconds"] for run in runs)
+            rss = statistics.median(run["rss_mb"] for run in runs)
+            print(f"{name:>20} {seconds:>8.3f} {rss:>8.1f}  {', '.join(runs[-1]['loaded']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# Bump when the model or output format changes so stale results are not reused
+# (by the result caches and by ResultStore.find)
+CACHE_VERSION = 7
+
+
+# SHA-256 of a seekable upload (a werkzeug FileStorage or binary stream),
+# read in chunks and rewound, so a workbook already stored or solved is
+# recognised without writing anything
+def upload_digest(file):
+    stream = getattr(file, "stream", file)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1 << 16), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+# Save an upload under the SHA-256 of its content, creating the folder on
+# first use; returns (digest, path). With the digest known (upload_digest())
+# a workbook already in the folder is not written again, only marked as
+# used so prune_uploads() keeps it.
+def store_upload(file, folder, digest=None):
+    stream = getattr(file, "stream", file)
+    if digest is not None:
+        path = os.path.join(folder, f"{digest}.xlsx")
+        try:
+            os.utime(path)
+            return digest, path
+        except OSError:
+            pass
+    digest = hashlib.sha256()
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(1 << 16), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        path = os.path.join(folder, f"{digest.hexdigest()}.xlsx")
+        if os.path.exists(path):
+            os.remove(tmp_path)  # Same content already stored
+            os.utime(path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest.hexdigest(), path
+
+
+# Delete stored uploads not used for max_age seconds, and .part files an
+# interrupted upload left behind; returns how many files were removed
+def prune_uploads(folder, max_age, part_age=3600):
+    now = time.time()
+    removed = 0
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        age = max_age if name.endswith(".xlsx") else part_age if name.endswith(".part") else None
+        path = os.path.join(folder, name)
+        try:
+            if age is not None and now - os.stat(path).st_mtime > age:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass  # Removed by another worker, or still being written
+    return removed
+
+
+def cache_key(workbook_hash, params):
+    payload = json.dumps({"workbook": workbook_hash, "params": params, "version": CACHE_VERSION},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# In-memory LRU cache bounded by entry count, total size and age
+class ResultCache:
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024, max_age=7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored_at, size, blob)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.max_age:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return pickle.loads(entry[2])
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            self._entries[key] = (time.time(), len(blob), blob)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, (stored_at, _, _) in self._entries.items() if now - stored_at > self.max_age]:
+            del self._entries[key]
+        total = sum(size for _, size, _ in self._entries.values())
+        while self._entries and (len(self._entries) > self.max_entries or total > self.max_bytes):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Same policy, persisted as one pickle per key so results survive restarts and
+# are shared by every process using the directory. File mtime is the LRU clock.
+# The directory is created by the first put.
+class DiskResultCache(ResultCache):
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.max_age:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)  # Mark as recently used
+        except (OSError, pickle.UnpicklingError, EOFError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            _, size, path = entries.pop(0)
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        try:
+            entries = sum(1 for name in os.listdir(self.directory) if name.endswith(".pkl"))
+        except FileNotFoundError:
+            entries = 0
+        with self._lock:
+            return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+
+def result_cache_from_config(config):
+    backend = config["RESULT_CACHE_BACKEND"]
+    if backend == "none":
+        return None
+    limits = {
+        "max_entries": config["RESULT_CACHE_MAX_ENTRIES"],
+        "max_bytes": config["RESULT_CACHE_MAX_BYTES"],
+        "max_age": config["RESULT_CACHE_MAX_AGE"],
+    }
+    if backend == "memory":
+        return ResultCache(**limits)
+    if backend == "disk":
+        return DiskResultCache(config["RESULT_CACHE_DIR"], **limits)
+    raise ValueError(f"Unknown RESULT_CACHE_BACKEND {backend!r}")
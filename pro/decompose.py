@@ -0,0 +1,93 @@
+from dataclasses import replace
+
+from ortools.sat.python import cp_model
+
+from model_builder import lab_option
+
+
+class _UnionFind:
+    def __init__(self, items):
+        self.parent = {item: item for item in items}
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+
+# Shared resources that tie sections together in the model: faculty (clash
+# constraints cover theory and lab teaching) and the lab rooms each of the
+# section's lab sessions may use.
+def section_resources(problem, section):
+    resources = {("faculty", faculty_id)
+                 for _, faculty_id in problem.section_subject_mapping.get(section, []) if faculty_id}
+    labs = problem.section_lab_mapping.get(section, [])
+    resources.update(("faculty", faculty_id) for _, faculty_id in labs if faculty_id)
+    for subject_id, _ in labs:
+        resources.update(("lab", room) for room in lab_option(problem, section, subject_id)[1])
+    return resources
+
+
+# Split items into connected components of the item/resource graph, where
+# resources(item) are the shared resources of one item. Components keep the
+# original item order and are largest first.
+def connected_groups(items, resources):
+    uf = _UnionFind(items)
+    owner = {}
+    for item in items:
+        for resource in resources(item):
+            if resource in owner:
+                uf.union(owner[resource], item)
+            else:
+                owner[resource] = item
+    components = {}
+    for item in items:
+        components.setdefault(uf.find(item), []).append(item)
+    return sorted(components.values(), key=len, reverse=True)
+
+
+def partition_sections(problem):
+    return connected_groups(problem.sections, lambda section: section_resources(problem, section))
+
+
+# The same problem restricted to a subset of sections
+def restrict_problem(problem, sections):
+    keep = set(sections)
+    return replace(
+        problem,
+        sections=[s for s in problem.sections if s in keep],
+        section_subject_mapping={s: v for s, v in problem.section_subject_mapping.items() if s in keep},
+        section_lab_mapping={s: v for s, v in problem.section_lab_mapping.items() if s in keep},
+        fixed_activities={s: v for s, v in problem.fixed_activities.items() if s in keep},
+    )
+
+
+# Worst status across components: one infeasible part makes the whole infeasible
+def combine_status(statuses):
+    for status in (cp_model.MODEL_INVALID, cp_model.INFEASIBLE, cp_model.UNKNOWN, cp_model.FEASIBLE):
+        if status in statuses:
+            return status
+    return cp_model.OPTIMAL
+
+
+def merge_stats(status, stats_list):
+    objectives = [stats["objective"] for stats in stats_list]
+    return {
+        "status": cp_model.CpSolver().status_name(status),
+        "wall_time": max(stats["wall_time"] for stats in stats_list),
+        "user_time": round(sum(stats["user_time"] for stats in stats_list), 3),
+        "branches": sum(stats["branches"] for stats in stats_list),
+        "conflicts": sum(stats["conflicts"] for stats in stats_list),
+        "objective": None if None in objectives else sum(objectives),
+        "best_bound": sum(stats["best_bound"] for stats in stats_list),
+        "components": len(stats_list),
+        **({"stopped": True} if any(stats.get("stopped") for stats in stats_list) else {}),
+    }
@@ -0,0 +1,47 @@
+# Edits to a solved timetable, checked in the web tier before a re-solve is
+# queued (see incremental.py, which applies them to the problem).
+#
+# A delta is a dict of edit lists, e.g.
+#   {"blocked_slots":    [{"faculty": "F12", "day": "Tuesday", "slot": 2}],
+#    "swap_faculty":     [{"from": "F12", "to": "F30", "section": "II_CSM_A", "subject": "CS201"}],
+#    "fixed_activities": [{"section": "II_CSM_A", "day": "Friday", "slot": 5, "activity": "Seminar"}]}
+# "section" and "subject" are optional on swaps (default: every class of "from").
+DELTA_FIELDS = {
+    "blocked_slots": ("faculty", "day", "slot"),
+    "swap_faculty": ("from", "to"),
+    "fixed_activities": ("section", "day", "slot", "activity"),
+}
+
+
+class DeltaError(ValueError):
+    pass
+
+
+def parse_delta(payload):
+    if not isinstance(payload, dict):
+        raise DeltaError("Delta must be a JSON object")
+    unknown = set(payload) - set(DELTA_FIELDS) - {"settings"}
+    if unknown:
+        raise DeltaError(f"Unknown delta field(s): {', '.join(sorted(unknown))}")
+    delta = {}
+    for kind, required in DELTA_FIELDS.items():
+        edits = payload.get(kind, [])
+        if not isinstance(edits, list) or not all(isinstance(edit, dict) for edit in edits):
+            raise DeltaError(f"'{kind}' must be a list of objects")
+        for edit in edits:
+            missing = [name for name in required if edit.get(name) in (None, "")]
+            if missing:
+                raise DeltaError(f"'{kind}' entry {edit} is missing {', '.join(missing)}")
+        delta[kind] = edits
+    if not any(delta.values()):
+        raise DeltaError("Delta is empty")
+    return delta
+
+
+# Later edits are applied after earlier ones
+def combine_deltas(*deltas):
+    combined = {kind: [] for kind in DELTA_FIELDS}
+    for delta in deltas:
+        for kind in DELTA_FIELDS:
+            combined[kind].extend((delta or {}).get(kind, []))
+    return combined
@@ -0,0 +1,13 @@
+# gunicorn settings used by start.sh. app imports no solver code, so the
+# master preloads it cheaply and the worker forks with the Flask app built.
+# Nothing in app starts a process or thread at import: the job pool, its
+# listener and the solver forkserver start in the worker on its first job.
+import os
+
+# Solves run in the app's own process pool (SOLVER_MAX_WORKERS), so a single
+# threaded web worker is enough and keeps the job table in one place. Job
+# event streams hold a thread each; app caps them at EVENTS_MAX_STREAMS, by
+# default half of WEB_THREADS.
+workers = 1
+threads = int(os.environ.get("WEB_THREADS", 8))
+preload_app = os.environ.get("WEB_PRELOAD", "1").lower() not in ("0", "false", "no")
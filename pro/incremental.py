@@ -0,0 +1,191 @@
+import logging
+from html import escape
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+from delta import DeltaError
+from loader import WorkbookError, load_timetable_data
+from metrics import collecting, span
+from model_builder import prepare_problem
+from settings import SolverSettings
+from presolve import check_problem
+from timetable import solve_problem, build_result, infeasible_conflicts, log_result, rejected_result
+
+logger = logging.getLogger(__name__)
+
+
+# Apply a delta to the problem in place. Returns the sections whose previous
+# placement can no longer be kept as it was.
+def apply_delta(problem, delta, assignment):
+    slots_by_name = {str(slot): slot for slot in problem.all_slots}
+
+    def slot_id(value):
+        if str(value) not in slots_by_name:
+            raise DeltaError(f"Unknown slot {value!r}")
+        return slots_by_name[str(value)]
+
+    def check_day(day):
+        if day not in problem.days:
+            raise DeltaError(f"Unknown day {day!r}")
+        return day
+
+    def check_section(section):
+        if section not in problem.section_subject_mapping and section not in problem.section_lab_mapping:
+            raise DeltaError(f"Unknown section {section!r}")
+        return section
+
+    # Faculty IDs in a delta are text, as /jobs/<id>/faculty lists them;
+    # the workbook's may be numbers
+    def faculty_ids():
+        ids = {}
+        for mapping in (problem.section_subject_mapping, problem.section_lab_mapping):
+            for entries in mapping.values():
+                for _, faculty_id in entries:
+                    if faculty_id is not None:
+                        ids.setdefault(str(faculty_id), faculty_id)
+        return ids
+
+    affected = set()
+
+    known = faculty_ids()
+    for edit in delta.get("swap_faculty", []):
+        section = check_section(edit["section"]) if edit.get("section") else None
+        swapped = False
+        for mapping in (problem.section_subject_mapping, problem.section_lab_mapping):
+            for sec, entries in mapping.items():
+                if section is not None and sec != section:
+                    continue
+                for i, (subject_id, faculty_id) in enumerate(entries):
+                    if faculty_id is None or str(faculty_id) != str(edit["from"]):
+                        continue
+                    if edit.get("subject") not in (None, "") and str(subject_id) != str(edit["subject"]):
+                        continue
+                    entries[i] = (subject_id, known.get(str(edit["to"]), edit["to"]))
+                    affected.add(sec)
+                    swapped = True
+        if not swapped:
+            raise DeltaError(f"No class taught by {edit['from']!r} matches {edit}")
+
+    for edit in delta.get("fixed_activities", []):
+        section = check_section(edit["section"])
+        day, slot = check_day(edit["day"]), slot_id(edit["slot"])
+        problem.fixed_activities.setdefault(section, {}).setdefault(day, {})[slot] = edit["activity"]
+        affected.add(section)
+
+    # Blocked slots only disturb sections that used the teacher at that time
+    known = faculty_ids()
+    blocked = {}
+    for edit in delta.get("blocked_slots", []):
+        if str(edit["faculty"]) not in known:
+            raise DeltaError(f"Faculty {edit['faculty']!r} teaches no class in this timetable")
+        blocked.setdefault(known[str(edit["faculty"])], set()).add((check_day(edit["day"]), slot_id(edit["slot"])))
+    for faculty_id, slots in blocked.items():
+        problem.faculty_blocked.setdefault(faculty_id, set()).update(slots)
+    if blocked and assignment:
+        faculty_of = {}
+        for mapping in (problem.section_subject_mapping, problem.section_lab_mapping):
+            for sec, entries in mapping.items():
+                for subject_id, faculty_id in entries:
+                    faculty_of[(sec, subject_id)] = faculty_id
+        for section, subject_id, day, *slots in assignment["labs"] + assignment["subjects"]:
+            busy = blocked.get(faculty_of.get((section, subject_id)), ())
+            if any((day, slot) in busy for slot in slots):
+                affected.add(section)
+
+    return affected
+
+
+# Hint every variable with its previous value and pin the sections the delta
+# does not touch, so CP-SAT only searches over the affected part
+def warm_start(assignment, pinned_sections):
+    def prepare(timetable_model):
+        model = timetable_model.model
+        compiled = timetable_model.compiled
+        positions = [{name: i for i, name in enumerate(names)}
+                     for names in (compiled.sections, compiled.subjects, compiled.days, compiled.slots)]
+        sizes = [len(position) for position in positions]
+
+        # (section, subject, day, first slot) as one integer
+        def encode(section, subject, day, slot):
+            return ((section * sizes[1] + subject) * sizes[2] + day) * sizes[3] + slot
+
+        def previous(entries):
+            keys = [encode(*(position[name] for position, name in zip(positions, entry[:4])))
+                    for entry in entries if all(name in position for position, name in zip(positions, entry[:4]))]
+            return np.array(keys, dtype=np.int64)
+
+        # A lab keeps its previous room, of the vars placing it as before; one
+        # from before rooms were recorded takes the first room it may use
+        def same_room(labs, values):
+            rooms = {(section, subject_id): room for section, subject_id, room in assignment.get("lab_rooms", [])}
+            for i in np.flatnonzero(values).tolist():
+                key = compiled.sections[labs.section[i]], compiled.subjects[labs.subject[i]]
+                room = compiled.rooms[labs.room[i]]
+                values[i] = rooms.get(key, room) == room
+            chosen = np.flatnonzero(values)
+            values[:] = False
+            values[chosen[np.unique(labs.row[chosen], return_index=True)[1]]] = True
+            return values
+
+        pinned = np.array([positions[0][section] for section in pinned_sections if section in positions[0]],
+                          dtype=np.int64)
+        for table, entries in ((timetable_model.labs, assignment["labs"]),
+                               (timetable_model.weekly, assignment["weekly"]),
+                               (timetable_model.regular, assignment["subjects"])):
+            values = np.isin(encode(table.section, table.subject, table.day, table.slot), previous(entries))
+            if table is timetable_model.labs:
+                values = same_room(table, values)
+            keep = np.isin(table.section, pinned)
+            for var, value, pin in zip(table.var.tolist(), values.tolist(), keep.tolist()):
+                model.add_hint(timetable_model.variables[var], value)
+                if pin:
+                    model.add(timetable_model.variables[var] == int(value))
+
+    return prepare
+
+
+def resolve_timetable(file_path, assignment, delta, settings=None, progress=None):
+    if progress is None:
+        progress = lambda stage, fraction=None, **info: None
+    if settings is None:
+        settings = SolverSettings()
+    with collecting() as collected:
+        try:
+            progress("loading", 0.05)
+            with span("parse"):
+                data = load_timetable_data(file_path)
+            with span("prepare"):
+                problem = prepare_problem(data)
+                affected = apply_delta(problem, delta, assignment)
+            pinned = set(problem.sections) - affected
+            with span("presolve"):
+                conflicts = check_problem(problem, settings.faculty_mode)
+
+            if conflicts:
+                result = rejected_result(settings, conflicts)
+            else:
+                status, stats, timetable_dict, new_assignment = solve_problem(
+                    problem, settings, progress, prepare_model=warm_start(assignment, pinned))
+                if pinned and status in (cp_model.INFEASIBLE, cp_model.UNKNOWN) and not stats.get("stopped"):
+                    # The untouched sections cannot stay as they were; free everything
+                    # but keep the previous timetable as hints
+                    progress("resolving", 0.5)
+                    pinned = set()
+                    status, stats, timetable_dict, new_assignment = solve_problem(
+                        problem, settings, progress, prepare_model=warm_start(assignment, pinned))
+                stats = dict(stats, affected_sections=len(affected), pinned_sections=len(pinned))
+
+                result = build_result(problem, settings, status, stats, timetable_dict, progress,
+                                      infeasible_conflicts(problem, settings, status, progress),
+                                      workbook=file_path, assignment=new_assignment, delta=delta)
+
+        except Exception as e:
+            if isinstance(e, (WorkbookError, DeltaError)):
+                logger.warning("Invalid re-solve of %s: %s", file_path, e)
+            else:
+                logger.exception("Re-solve failed for %s", file_path)
+            result = {"status": "error", "html": f"<p>Error: {escape(str(e))}</p>"}
+
+    log_result(file_path, result, collected)
+    return dict(result, metrics=collected)
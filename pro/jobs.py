@@ -0,0 +1,262 @@
+import importlib
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+# Event queue and stop flags shared with the pool workers (set by
+# _init_worker in each child). Each pending job owns one stop flag slot.
+_event_queue = None
+_stop_flags = None
+
+
+# Also imports the preload modules, so a worker loads the solver once at
+# start rather than with its first job (a no-op under forkserver, where the
+# server process already imported them)
+def _init_worker(event_queue, stop_flags, preload=()):
+    global _event_queue, _stop_flags
+    _event_queue = event_queue
+    _stop_flags = stop_flags
+    for module in preload:
+        importlib.import_module(module)
+
+
+# A job target is a callable or "module:function", looked up in the worker
+# so the web process never has to import the module
+def _resolve(target):
+    if isinstance(target, str):
+        module, name = target.split(":")
+        return getattr(importlib.import_module(module), name)
+    return target
+
+
+# The progress callback handed to job targets. Calling it reports a stage;
+# solution() publishes an intermediate timetable and stop_requested() tells
+# the solver whether the user asked to stop.
+class JobProgress:
+    def __init__(self, job_id, slot):
+        self.job_id = job_id
+        self.slot = slot
+
+    def __call__(self, stage, fraction=None, **info):
+        _event_queue.put((self.job_id, "progress", dict(info, stage=stage, fraction=fraction)))
+
+    def solution(self, **info):
+        _event_queue.put((self.job_id, "solution", info))
+
+    def stop_requested(self):
+        return bool(_stop_flags[self.slot])
+
+
+# Runs inside a pool worker: reports state changes back to the web process
+def _run_job(job_id, slot, target, args, kwargs):
+    if _stop_flags[slot]:
+        raise CancelledError()  # Stopped while waiting for a worker
+    _event_queue.put((job_id, RUNNING, None))
+    return _resolve(target)(*args, progress=JobProgress(job_id, slot), **kwargs)
+
+
+class JobManager:
+    # on_finish(job_id, result, created) runs in the web process for every
+    # job that ends with a result, e.g. to persist it. Pool workers start by
+    # start_method (default forkserver where the platform has it) and import
+    # the preload modules before their first job: with forkserver they fork
+    # from one server process that imported them once, so the web process
+    # itself never loads them.
+    def __init__(self, max_workers=2, max_queue=8, keep_finished=200, on_finish=None, start_method=None,
+                 preload=()):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.keep_finished = keep_finished
+        self.on_finish = on_finish
+        if start_method is None and "forkserver" in multiprocessing.get_all_start_methods():
+            start_method = "forkserver"
+        self.start_method = start_method
+        self.preload = tuple(preload)
+        self._jobs = {}
+        self._futures = {}
+        self._slots = {}
+        self._free_slots = list(range(max_workers + max_queue))
+        self._lock = threading.Lock()
+        # The pool and the listener thread are created on first use so the
+        # manager survives being imported before a fork (gunicorn --preload)
+        self._executor = None
+        self._events = None
+        self._stop_flags = None
+        self._listener = None
+
+    def _ensure_started(self):
+        if self._executor is not None:
+            return
+        ctx = multiprocessing.get_context(self.start_method)
+        if ctx.get_start_method() == "forkserver":
+            ctx.set_forkserver_preload(list(self.preload))
+        self._events = ctx.Queue()
+        if self._stop_flags is None:
+            self._stop_flags = ctx.RawArray("b", self.max_workers + self.max_queue)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self._events, self._stop_flags, self.preload),
+        )
+        self._listener = threading.Thread(target=self._listen, name="job-events", daemon=True)
+        self._listener.start()
+
+    # Drain worker events and update the job table
+    def _listen(self):
+        events = self._events
+        while True:
+            try:
+                job_id, kind, info = events.get()
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] in (FINISHED, FAILED):
+                    continue
+                if kind == RUNNING:
+                    job["status"] = RUNNING
+                    job["started"] = time.time()
+                elif kind == "progress":
+                    job["progress"] = info
+                elif kind == "solution":
+                    job["solution"] = info
+                job["updates"] += 1
+
+    def _pending(self):
+        return sum(1 for job in self._jobs.values() if job["status"] in (QUEUED, RUNNING))
+
+    # Forget the oldest finished jobs once more than keep_finished are held
+    def _evict(self):
+        done = [job for job in self._jobs.values() if job["status"] in (FINISHED, FAILED)]
+        if len(done) <= self.keep_finished:
+            return
+        done.sort(key=lambda job: job["finished"])
+        for job in done[:len(done) - self.keep_finished]:
+            del self._jobs[job["id"]]
+
+    # target is a callable or "module:function" (see _resolve). on_result(result)
+    # runs in the web process when the job succeeds.
+    def submit(self, target, *args, on_result=None, **kwargs):
+        with self._lock:
+            if self._pending() >= self.max_workers + self.max_queue:
+                raise QueueFullError("Too many timetable jobs are queued, please retry shortly.")
+            self._ensure_started()
+            job_id = uuid.uuid4().hex
+            slot = self._free_slots.pop()
+            self._stop_flags[slot] = 0
+            self._jobs[job_id] = self._new_job(job_id, QUEUED)
+            self._slots[job_id] = slot
+            try:
+                future = self._executor.submit(_run_job, job_id, slot, target, args, kwargs)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM); start a fresh pool and retry once
+                self._executor = None
+                self._ensure_started()
+                future = self._executor.submit(_run_job, job_id, slot, target, args, kwargs)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f, on_result))
+        return job_id
+
+    # Record a result that needed no solve (e.g. served from the cache, or
+    # one workbook of a finished batch under an ID derived from the batch's)
+    def add_result(self, result, job_id=None):
+        now = time.time()
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = dict(self._new_job(job_id, FINISHED), started=now, finished=now, result=result)
+            self._evict()
+        if self.on_finish is not None:
+            self.on_finish(job_id, result, now)
+        return job_id
+
+    @staticmethod
+    def _new_job(job_id, status):
+        return {
+            "id": job_id,
+            "status": status,
+            "progress": None,
+            "solution": None,   # latest intermediate timetable while solving
+            "updates": 0,       # bumped on every change, for event streams
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "result": None,
+            "error": None,
+        }
+
+    # Ask a queued or running job to stop. A queued job is cancelled; a
+    # running solve ends early with the best timetable found so far.
+    def stop(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] not in (QUEUED, RUNNING):
+                return False
+            future = self._futures.get(job_id)
+        # cancel() runs the done callback, which takes the lock
+        if future is not None and future.cancel():
+            return True
+        with self._lock:
+            if job_id in self._slots:
+                self._stop_flags[self._slots[job_id]] = 1
+        return True
+
+    def _finish(self, job_id, future, on_result=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["finished"] = time.time()
+            if job["started"] is None:
+                job["started"] = job["finished"]
+            try:
+                job["result"] = future.result()
+                job["status"] = FINISHED
+            except CancelledError:
+                job["error"] = "Stopped before it started"
+                job["status"] = FAILED
+            except Exception as e:
+                job["error"] = str(e) or e.__class__.__name__
+                job["status"] = FAILED
+            job["updates"] += 1
+            self._futures.pop(job_id, None)
+            self._free_slots.append(self._slots.pop(job_id))
+            self._evict()
+            result, created = job["result"], job["created"]
+        if result is not None:
+            if self.on_finish is not None:
+                self.on_finish(job_id, result, created)
+            if on_result is not None:
+                on_result(result)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stats(self):
+        with self._lock:
+            counts = {state: 0 for state in (QUEUED, RUNNING, FINISHED, FAILED)}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+        return dict(counts, max_workers=self.max_workers, max_queue=self.max_queue)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
@@ -0,0 +1,99 @@
+from dataclasses import dataclass, field
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from sheets import REQUIRED_SHEETS, OPTIONAL_SHEETS, WorkbookError
+
+# Columns used to build section keys / match days, always compared as text
+TEXT_COLUMNS = ["Year", "Department", "Section", "Day"]
+
+
+@dataclass
+class TimetableData:
+    sections: pd.DataFrame
+    subjects: pd.DataFrame
+    teachers: pd.DataFrame
+    timeslots: pd.DataFrame
+    section_subjects: pd.DataFrame
+    fixed_activities: pd.DataFrame
+    lab_sessions: pd.DataFrame
+    weekly_once: pd.DataFrame
+    target_subjects: pd.DataFrame
+    lab_rooms: pd.DataFrame = field(default_factory=pd.DataFrame)
+
+
+# Attribute on TimetableData for every sheet
+SHEET_FIELDS = {
+    "Sections Data": "sections",
+    "Subjects Data": "subjects",
+    "Teachers Data": "teachers",
+    "Time Slot Data": "timeslots",
+    "Section Subjects Data": "section_subjects",
+    "Fixed Activities": "fixed_activities",
+    "Lab Sessions": "lab_sessions",
+    "WeeklyOnce Subjects": "weekly_once",
+    "Target Subjects": "target_subjects",
+    "Lab Rooms": "lab_rooms",
+}
+
+
+def _sheet_frame(worksheet):
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+    # Trailing empty header cells show up as None in read-only mode
+    width = len(header)
+    while width and header[width - 1] is None:
+        width -= 1
+    columns = [str(name).strip() for name in header[:width]]
+    records = [row[:width] for row in rows if any(value is not None for value in row[:width])]
+    df = pd.DataFrame.from_records(records, columns=columns)
+    return df.infer_objects()
+
+
+# Check sheets and columns before anything is built from them
+def validate_frames(frames):
+    problems = []
+    for sheet, columns in {**REQUIRED_SHEETS, **OPTIONAL_SHEETS}.items():
+        if sheet not in frames:
+            if sheet in REQUIRED_SHEETS:
+                problems.append(f"missing sheet '{sheet}'")
+            continue
+        missing = [col for col in columns if col not in frames[sheet].columns]
+        if missing:
+            problems.append(f"sheet '{sheet}' is missing column(s) {', '.join(repr(c) for c in missing)}")
+    if problems:
+        raise WorkbookError("Invalid workbook: " + "; ".join(problems))
+
+
+def from_frames(frames):
+    validate_frames(frames)
+    tables = {}
+    for sheet, name in SHEET_FIELDS.items():
+        if sheet not in frames:
+            continue  # An optional sheet the workbook does not have
+        df = frames[sheet].copy()
+        for col in TEXT_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype(str).str.strip()
+        tables[name] = df
+    return TimetableData(**tables)
+
+
+# Read every sheet the solver uses in a single pass over the workbook
+def load_timetable_data(source):
+    try:
+        workbook = load_workbook(source, read_only=True, data_only=True)
+    except Exception as e:
+        raise WorkbookError(f"Could not read workbook: {e}") from e
+    try:
+        frames = {
+            sheet: _sheet_frame(workbook[sheet])
+            for sheet in SHEET_FIELDS
+            if sheet in workbook.sheetnames
+        }
+    finally:
+        workbook.close()
+    return from_frames(frames)
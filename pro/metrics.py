@@ -0,0 +1,143 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Timing spans and counters of the job running in this context. Solver code
+# records into whatever collecting() block is active; outside one, nothing
+# is kept.
+_collected = ContextVar("collected", default=None)
+
+
+@contextmanager
+def collecting():
+    collected = {"spans": {}, "counters": {}}
+    token = _collected.set(collected)
+    try:
+        yield collected
+    finally:
+        _collected.reset(token)
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        collected = _collected.get()
+        if collected is not None:
+            spans = collected["spans"]
+            spans[name] = round(spans.get(name, 0.0) + time.perf_counter() - start, 6)
+
+
+def count(name, value=1):
+    collected = _collected.get()
+    if collected is not None:
+        collected["counters"][name] = collected["counters"].get(name, 0) + value
+
+
+# Add spans and counters collected elsewhere (e.g. in a child process)
+def merge(other):
+    collected = _collected.get()
+    if collected is None or not other:
+        return
+    for name, seconds in other["spans"].items():
+        collected["spans"][name] = round(collected["spans"].get(name, 0.0) + seconds, 6)
+    for name, value in other["counters"].items():
+        collected["counters"][name] = collected["counters"].get(name, 0) + value
+
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in sorted(labels.items())) + "}"
+
+
+# Counters and histograms in the Prometheus text format. Only the web
+# process holds one; workers send their measurements back with each result.
+class Registry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}    # name -> {labels: value}
+        self._histograms = {}  # name -> {labels: [bucket counts..., sum, count]}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    # sampled: {name: (type, [(labels dict, value)])} read at scrape time
+    def render(self, sampled=None):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines += self._header(name, "counter")
+                lines += [f"{name}{_labels(dict(key))} {value}" for key, value in sorted(series.items())]
+            for name, series in sorted(self._histograms.items()):
+                lines += self._header(name, "histogram")
+                for key, state in sorted(series.items()):
+                    labels = dict(key)
+                    for bound, n in zip(self.buckets, state):
+                        lines.append(f"{name}_bucket{_labels(dict(labels, le=bound))} {n}")
+                    lines.append(f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {state[-1]}")
+                    lines.append(f"{name}_sum{_labels(labels)} {round(state[-2], 6)}")
+                    lines.append(f"{name}_count{_labels(labels)} {state[-1]}")
+        for name, (kind, samples) in sorted((sampled or {}).items()):
+            lines += self._header(name, kind)
+            lines += [f"{name}{_labels(labels)} {value}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+    def _header(self, name, kind):
+        header = [f"# HELP {name} {self._help[name]}"] if name in self._help else []
+        return header + [f"# TYPE {name} {kind}"]
+
+
+REGISTRY = Registry()
+REGISTRY.describe("timetable_jobs_total", "Timetable jobs finished, by result status.")
+REGISTRY.describe("timetable_stage_seconds", "Time spent in each stage of a timetable job.")
+REGISTRY.describe("timetable_solver_seconds", "CP-SAT wall time per solve.")
+REGISTRY.describe("timetable_solver_branches_total", "CP-SAT search branches.")
+REGISTRY.describe("timetable_solver_conflicts_total", "CP-SAT search conflicts.")
+REGISTRY.describe("timetable_model_variables_total", "CP-SAT variables created.")
+REGISTRY.describe("timetable_model_constraints_total", "CP-SAT constraints created.")
+REGISTRY.describe("timetable_jobs", "Jobs currently held by this web process, by state.")
+REGISTRY.describe("timetable_job_slots", "Jobs that can run or wait at once.")
+REGISTRY.describe("timetable_cache_entries", "Results in the result cache.")
+REGISTRY.describe("timetable_cache_requests_total", "Result cache lookups, by outcome.")
+REGISTRY.describe("timetable_store_results", "Results in the persistent result store.")
+
+
+# Fold one finished job's measurements into the registry
+def record_job(result, registry=REGISTRY):
+    registry.inc("timetable_jobs_total", status=result["status"])
+    measured = result.get("metrics") or {}
+    for stage, seconds in measured.get("spans", {}).items():
+        registry.observe("timetable_stage_seconds", seconds, stage=stage)
+    for name, value in measured.get("counters", {}).items():
+        registry.inc(f"timetable_{name}_total", value)
+    stats = (result.get("solver") or {}).get("stats")
+    if stats:
+        registry.observe("timetable_solver_seconds", stats["wall_time"], status=stats["status"])
+        registry.inc("timetable_solver_branches_total", stats["branches"])
+        registry.inc("timetable_solver_conflicts_total", stats["conflicts"])
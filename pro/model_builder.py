@@ -0,0 +1,668 @@
+import logging
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from ortools.sat.python import cp_model
+from ortools.sat.python.cp_model import LinearExpr
+
+from loader import WorkbookError
+from settings import FACULTY_MODES, SoftWeights
+
+logger = logging.getLogger(__name__)
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+BREAK_TYPES = ["Break", "Lunch"]
+
+# Periods every regular subject gets per week, and the most it may take in a day
+MIN_PERIODS_PER_WEEK = 5
+MAX_PERIODS_PER_DAY = 2
+# Most theory periods a subject gets per week; lab periods come on top
+MAX_THEORY_PER_WEEK = 5
+# Free periods a section may have per week before each one costs SoftWeights.free
+FREE_PERIODS_PER_WEEK = 1
+# Consecutive slots a lab session takes unless Lab Sessions gives a Duration
+LAB_SLOTS = 2
+
+
+# Plain-Python view of the workbook that the builder and the output stage share
+@dataclass
+class Problem:
+    sections: list
+    days: list
+    timeslots_data: list
+    all_slots: list
+    break_slots: set
+    years: list
+    subject_dict: dict
+    section_subject_mapping: dict
+    section_lab_mapping: dict
+    fixed_activities: dict
+    weekly_once_by_year: dict
+    target_subjects: set
+    faculty_modes: dict = field(default_factory=dict)  # faculty_id -> per-faculty FACULTY_MODES override
+    faculty_blocked: dict = field(default_factory=dict)  # faculty_id -> {(day, slot)} they cannot teach
+    faculty_limits: dict = field(default_factory=dict)  # faculty_id -> (most periods a day, a week); None = no cap
+    lab_rooms: dict = field(default_factory=dict)  # room -> lab sessions it holds at once
+    lab_options: dict = field(default_factory=dict)  # (section, subject_id) -> (slots, [rooms it may use])
+
+
+# The problem with sections, subjects, faculty, days and slots mapped to
+# dense integer IDs (positions in the lists below) and every requirement held
+# as a row of an int32 array. The builder and the extraction work off these.
+@dataclass
+class CompiledProblem:
+    sections: list        # section ID -> "Year_Department_Section"
+    subjects: list        # subject ID -> workbook Subject ID
+    faculty: list         # faculty ID -> workbook Faculty ID
+    days: list
+    slots: list
+    open: np.ndarray      # (sections, days, slots) bool: no break and no fixed activity
+    blocked: np.ndarray   # (faculty + 1, days, slots) bool; the last row (faculty -1, none) is never blocked
+    daily_cap: np.ndarray  # (faculty + 1,) most periods a teacher teaches a day, -1 = no cap
+    weekly_cap: np.ndarray  # (faculty + 1,) most periods a teacher teaches a week, -1 = no cap
+    rooms: list           # room ID -> lab room name
+    room_capacity: np.ndarray  # (rooms,) lab sessions a room holds at once
+    regular: np.ndarray   # rows of (section, subject, faculty), one per subject of a section
+    labs: np.ndarray      # rows of (section, subject, faculty), one per lab session of a section
+    lab_slots: np.ndarray  # (labs,) consecutive slots each lab session takes
+    lab_room: np.ndarray  # (labs, rooms) bool: the rooms each lab session may use
+    weekly: np.ndarray    # rows of (section, subject), one per Weekly Once subject of a section
+
+
+# One CP-SAT Bool var per row: the requirement row it places and where
+@dataclass
+class VarTable:
+    row: np.ndarray       # row of CompiledProblem.regular / .labs / .weekly
+    section: np.ndarray
+    subject: np.ndarray
+    day: np.ndarray
+    slot: np.ndarray      # first slot of a lab
+    var: np.ndarray       # variable index
+    room: np.ndarray = None  # lab room ID, labs only
+
+
+@dataclass
+class TimetableModel:
+    model: cp_model.CpModel
+    compiled: CompiledProblem
+    variables: list       # the placement vars, by variable index
+    labs: VarTable
+    weekly: VarTable
+    regular: VarTable
+    faculty_cells: tuple  # (faculty, day, slot, var) arrays: each period a var has its teacher teach
+    section_cells: tuple  # (cell, var) arrays: each (section, day, slot) cell a var fills, listed once
+    subject_days: tuple   # (row, day, var) arrays: each period a var gives a regular subject
+    penalty_vars: list = field(default_factory=list)
+    soft_terms: list = field(default_factory=list)  # (weight, var) pairs added to the objective
+    requirements: dict = field(default_factory=dict)  # (kind, section, subject_id) -> constraint placing it
+    penalty_weight: int = 5
+
+
+def _records(df, columns):
+    return zip(*(df[col].tolist() for col in columns))
+
+
+def _faculty(value):
+    # Empty Faculty ID cells arrive as NaN
+    return None if value is None or value != value else value
+
+
+def _column(df, col):
+    return df[col].tolist() if col in df.columns else [None] * len(df)
+
+
+# "Monday 1-3, 6; Friday" -> {(day, slot)}. Entries are split by ";" or new
+# lines; each names a day (in full or its first three letters) and then the
+# slots or slot ranges that day, or nothing for the whole day.
+def parse_unavailable(text, days, slots, faculty_id=None):
+    day_names = {name.lower(): day for day in days for name in (day, day[:3])}
+    slot_pos = {str(slot).strip(): i for i, slot in enumerate(slots)}
+    cells = set()
+    for entry in re.split(r"[;\n]", str(text)):
+        words = [word for word in re.split(r"[\s,]+", re.sub(r"\s*-\s*", "-", entry.strip())) if word]
+        if not words:
+            continue
+        day = day_names.get(words[0].lower())
+        if day is None:
+            raise WorkbookError(f"Teachers Data: unknown day {words[0]!r} in the unavailable times of {faculty_id}")
+        if len(words) == 1:
+            cells.update((day, slot) for slot in slots)
+        for word in words[1:]:
+            first, _, last = word.partition("-")
+            if first not in slot_pos or (last or first) not in slot_pos:
+                raise WorkbookError(f"Teachers Data: unknown slot {word!r} in the unavailable times of {faculty_id}")
+            cells.update((day, slot) for slot in slots[slot_pos[first]:slot_pos[last or first] + 1])
+    return cells
+
+
+def _blank(value):
+    return value is None or value != value or str(value).strip() == ""
+
+
+# An optional whole-number cell: None when empty, WorkbookError below minimum
+def _whole(value, what, minimum=0):
+    if _blank(value):
+        return None
+    try:
+        number = int(float(value))
+    except ValueError:
+        number = minimum - 1
+    if number < minimum:
+        raise WorkbookError(f"{what} must be a whole number of at least {minimum}, not {value!r}")
+    return number
+
+
+# (slots, [rooms]) of a section's lab session; a lab the workbook gave no
+# options has LAB_SLOTS slots and the room named by its Subject ID, shared
+# by every section taking that lab
+def lab_option(problem, section, subject_id):
+    return problem.lab_options.get((section, subject_id), (LAB_SLOTS, [str(subject_id)]))
+
+
+def lab_capacity(problem, room):
+    return problem.lab_rooms.get(room, 1)
+
+
+def prepare_problem(data):
+    df_sections = data.sections
+    sections = [f"{y}_{d}_{s}" for y, d, s in _records(df_sections, ["Year", "Department", "Section"])]
+    timeslots_data = data.timeslots.to_dict(orient="records")
+    all_slots = [slot["Slot ID"] for slot in timeslots_data]
+    break_slots = {slot["Slot ID"] for slot in timeslots_data if slot.get("Break Type", "None") in BREAK_TYPES}
+    years = df_sections["Year"].astype(str).unique().tolist()
+    subject_dict = dict(zip(data.subjects["Subject ID"], data.subjects["Subject Name"]))
+
+    # Mapping sections to subjects and assigned faculty
+    section_subject_mapping = {}
+    for y, d, s, subject_id, faculty_id in _records(
+            data.section_subjects, ["Year", "Department", "Section", "Subject ID", "Faculty ID"]):
+        section_subject_mapping.setdefault(f"{y}_{d}_{s}", []).append((subject_id, _faculty(faculty_id)))
+
+    # Mapping sections to lab sessions
+    section_lab_mapping = {}
+    for y, d, s, subject_id, faculty_id in _records(
+            data.lab_sessions, ["Year", "Department", "Section", "Subject ID", "Faculty ID"]):
+        section_lab_mapping.setdefault(f"{y}_{d}_{s}", []).append((subject_id, _faculty(faculty_id)))
+
+    # Fixed activity mapping
+    fixed_activities = {}
+    for y, d, s, day, slot_id, activity in _records(
+            data.fixed_activities, ["Year", "Department", "Section", "Day", "Slot ID", "Activity"]):
+        fixed_activities.setdefault(f"{y}_{d}_{s}", {}).setdefault(day, {})[slot_id] = activity
+
+    # Weekly Once subjects grouped by year
+    weekly_once_by_year = {}
+    for year, subject_id in _records(data.weekly_once, ["Year", "Subject ID"]):
+        weekly_once_by_year.setdefault(year, []).append(subject_id)
+
+    # Optional "Conflict Mode" column on the Teachers sheet
+    faculty_modes = {}
+    if {"Faculty ID", "Conflict Mode"} <= set(data.teachers.columns):
+        for faculty_id, mode in _records(data.teachers, ["Faculty ID", "Conflict Mode"]):
+            mode = str(mode).strip().lower()
+            if mode in FACULTY_MODES:
+                faculty_modes[faculty_id] = mode
+
+    # Optional availability and workload columns on the Teachers sheet:
+    # "Unavailable" times (see parse_unavailable) get no variables at all,
+    # "Max Periods Per Day" / "Max Periods Per Week" are hard caps
+    faculty_blocked, faculty_limits = {}, {}
+    if "Faculty ID" in data.teachers.columns:
+        teachers = data.teachers
+        for faculty_id, unavailable, per_day, per_week in zip(
+                teachers["Faculty ID"].tolist(), _column(teachers, "Unavailable"),
+                _column(teachers, "Max Periods Per Day"), _column(teachers, "Max Periods Per Week")):
+            if _faculty(faculty_id) is None:
+                continue
+            if not _blank(unavailable):
+                cells = parse_unavailable(unavailable, DAYS, all_slots, faculty_id)
+                if cells:
+                    faculty_blocked.setdefault(faculty_id, set()).update(cells)
+            limits = (_whole(per_day, f"Teachers Data: Max Periods Per Day of {faculty_id}"),
+                      _whole(per_week, f"Teachers Data: Max Periods Per Week of {faculty_id}"))
+            if limits != (None, None):
+                faculty_limits[faculty_id] = limits
+
+    # Lab rooms from the optional "Lab Rooms" sheet (Room, Capacity: sessions
+    # at once, default 1). Lab Sessions may give a session's "Duration" in
+    # slots and the "Room"s it may use, comma separated; with no room given
+    # a session may use any room on the sheet, or without the sheet its
+    # subject's own room (see lab_option)
+    lab_rooms = {}
+    for room, capacity in zip(_column(data.lab_rooms, "Room"), _column(data.lab_rooms, "Capacity")):
+        if not _blank(room):
+            lab_rooms[str(room).strip()] = _whole(capacity, f"Lab Rooms: Capacity of {room}", minimum=1) or 1
+    lab_options = {}
+    labs = data.lab_sessions
+    for y, d, s, subject_id, duration, rooms in zip(
+            labs["Year"].tolist(), labs["Department"].tolist(), labs["Section"].tolist(), labs["Subject ID"].tolist(),
+            _column(labs, "Duration"), _column(labs, "Room")):
+        section = f"{y}_{d}_{s}"
+        slots = _whole(duration, f"Lab Sessions: Duration of {subject_id} in {section}", minimum=1) or LAB_SLOTS
+        if _blank(rooms):
+            choice = list(lab_rooms) if lab_rooms else [str(subject_id)]
+        else:
+            choice = [room.strip() for room in str(rooms).split(",") if room.strip()]
+            unknown = [room for room in choice if room not in lab_rooms]
+            if unknown:
+                raise WorkbookError(f"Lab Sessions: {subject_id} in {section} uses room(s) {', '.join(unknown)}"
+                                    f" not listed on the Lab Rooms sheet")
+        lab_options.setdefault((section, subject_id), (slots, choice))
+
+    return Problem(
+        sections=sections,
+        days=list(DAYS),
+        timeslots_data=timeslots_data,
+        all_slots=all_slots,
+        break_slots=break_slots,
+        years=years,
+        subject_dict=subject_dict,
+        section_subject_mapping=section_subject_mapping,
+        section_lab_mapping=section_lab_mapping,
+        fixed_activities=fixed_activities,
+        weekly_once_by_year=weekly_once_by_year,
+        target_subjects=set(data.target_subjects["Target Subjects"]),
+        faculty_modes=faculty_modes,
+        faculty_blocked=faculty_blocked,
+        faculty_limits=faculty_limits,
+        lab_rooms=lab_rooms,
+        lab_options=lab_options,
+    )
+
+
+def _ids(values, index):
+    return [index.setdefault(value, len(index)) for value in values]
+
+
+def compile_problem(problem):
+    days, slots = list(problem.days), list(problem.all_slots)
+    day_pos = {day: i for i, day in enumerate(days)}
+    slot_pos = {slot: i for i, slot in enumerate(slots)}
+    section_pos = {section: i for i, section in enumerate(problem.sections)}
+    subject_pos, faculty_pos = {}, {}
+
+    def rows(mapping):
+        # One row per subject of a section; a repeated subject keeps its first teacher
+        table = {}
+        for section, entries in mapping.items():
+            if section in section_pos:
+                for subject_id, faculty_id in entries:
+                    table.setdefault((section_pos[section], subject_id), faculty_id)
+        return [(section, _ids([subject_id], subject_pos)[0], -1 if faculty_id is None else _ids([faculty_id], faculty_pos)[0])
+                for (section, subject_id), faculty_id in table.items()]
+
+    regular, labs = rows(problem.section_subject_mapping), rows(problem.section_lab_mapping)
+    weekly = []
+    for section, name in enumerate(problem.sections):
+        year_subjects = dict.fromkeys(problem.weekly_once_by_year.get(name.split("_")[0], []))
+        weekly.extend((section, subject) for subject in _ids(year_subjects, subject_pos))
+
+    open_slots = np.ones((len(section_pos), len(days), len(slots)), dtype=bool)
+    open_slots[:, :, [slot_pos[slot] for slot in problem.break_slots if slot in slot_pos]] = False
+    for section, by_day in problem.fixed_activities.items():
+        for day, activities in by_day.items():
+            for slot in activities:
+                if section in section_pos and day in day_pos and slot in slot_pos:
+                    open_slots[section_pos[section], day_pos[day], slot_pos[slot]] = False
+
+    _ids(problem.faculty_blocked, faculty_pos)
+    blocked = np.zeros((len(faculty_pos) + 1, len(days), len(slots)), dtype=bool)
+    for faculty_id, cells in problem.faculty_blocked.items():
+        for day, slot in cells:
+            if day in day_pos and slot in slot_pos:
+                blocked[faculty_pos[faculty_id], day_pos[day], slot_pos[slot]] = True
+    daily_cap = np.full(len(faculty_pos) + 1, -1, dtype=np.int32)
+    weekly_cap = np.full(len(faculty_pos) + 1, -1, dtype=np.int32)
+    for faculty_id, (per_day, per_week) in problem.faculty_limits.items():
+        if faculty_id in faculty_pos:
+            daily_cap[faculty_pos[faculty_id]] = -1 if per_day is None else per_day
+            weekly_cap[faculty_pos[faculty_id]] = -1 if per_week is None else per_week
+
+    subject_ids = list(subject_pos)
+    options = [lab_option(problem, problem.sections[section], subject_ids[subject]) for section, subject, _ in labs]
+    room_pos = {}
+    _ids(problem.lab_rooms, room_pos)
+    lab_room = np.zeros((len(labs), len(room_pos) + sum(len(rooms) for _, rooms in options)), dtype=bool)
+    for row, (_, rooms) in enumerate(options):
+        lab_room[row, _ids(rooms, room_pos)] = True
+
+    return CompiledProblem(
+        sections=list(problem.sections),
+        subjects=list(subject_pos),
+        faculty=list(faculty_pos),
+        days=days,
+        slots=slots,
+        open=open_slots,
+        blocked=blocked,
+        daily_cap=daily_cap,
+        weekly_cap=weekly_cap,
+        rooms=list(room_pos),
+        room_capacity=np.array([lab_capacity(problem, room) for room in room_pos], dtype=np.int32),
+        regular=np.array(regular, dtype=np.int32).reshape(-1, 3),
+        labs=np.array(labs, dtype=np.int32).reshape(-1, 3),
+        lab_slots=np.array([slots for slots, _ in options], dtype=np.int32),
+        lab_room=lab_room[:, :len(room_pos)],
+        weekly=np.array(weekly, dtype=np.int32).reshape(-1, 2),
+    )
+
+
+# Values grouped by equal integer key: (keys, [value arrays]), keys
+# ascending. With unique, a value repeated under one key is kept once.
+def _groups(keys, values, unique=False):
+    keys, values = np.asarray(keys, dtype=np.int64), np.asarray(values, dtype=np.int64)
+    if not len(keys):
+        return keys, []
+    if unique:
+        width = int(values.max()) + 1
+        pairs = np.unique(keys * width + values)
+        keys, values = pairs // width, pairs % width
+    else:
+        order = np.argsort(keys, kind="stable")
+        keys, values = keys[order], values[order]
+    bounds = np.flatnonzero(np.diff(keys)) + 1
+    return keys[np.r_[0, bounds]], np.split(values, bounds)
+
+
+def _concat(parts, dtype=np.int64):
+    return np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+
+
+def build_model(problem, faculty_mode="soft", weights=None):
+    timetable_model = build_core(problem)
+    add_faculty_constraints(timetable_model, problem.faculty_modes, faculty_mode)
+    add_soft_constraints(timetable_model, SoftWeights() if weights is None else weights)
+    set_objective(timetable_model)
+    return timetable_model
+
+
+# Variables and section-level constraints, built from the compiled problem.
+# Where a var can go is a boolean mask over (day, slot); constraint families
+# are generated by grouping the var tables on integer keys such as
+# (day, slot) or (section, day), so build time is linear in the number of
+# variables. Vars are unnamed: names only cost memory in the model. Faculty
+# clashes and the objective are added by the callers.
+def build_core(problem, compiled=None):
+    compiled = compile_problem(problem) if compiled is None else compiled
+    model = cp_model.CpModel()
+    n_days, n_slots = len(compiled.days), len(compiled.slots)
+    variables = []
+    requirements = {}
+
+    def new_vars(count):
+        start = len(variables)
+        variables.extend(model.new_bool_var("") for _ in range(count))
+        return np.arange(start, len(variables))
+
+    def literals(indexes):
+        return [variables[i] for i in indexes]
+
+    def table(requirement_rows, parts, columns=4):
+        row, day, slot, var, *room = (_concat([part[i] for part in parts]) for i in range(columns))
+        return VarTable(row=row, section=requirement_rows[row, 0].astype(np.int64),
+                        subject=requirement_rows[row, 1].astype(np.int64), day=day, slot=slot, var=var,
+                        room=room[0] if room else None)
+
+    def requirement_key(kind, rows, row):
+        section, subject = rows[row, 0], rows[row, 1]
+        return kind, compiled.sections[section], compiled.subjects[subject]
+
+    # Step 1: Lab sessions on consecutive slots, skipping breaks, fixed
+    # activities and periods the teacher is unavailable. Each one gets a
+    # var per room it may use and start of a run of open slots.
+    def runs(cells, length):
+        # runs[..., s]: cells s .. s + length - 1 all set
+        if length > n_slots:
+            return np.zeros(cells.shape[:-1] + (0,), dtype=bool)
+        return np.lib.stride_tricks.sliding_window_view(cells, length, axis=-1).all(axis=-1)
+
+    parts = []
+    for row, (section, _, faculty_id) in enumerate(compiled.labs):
+        length = int(compiled.lab_slots[row])
+        days, slots = np.nonzero(runs(compiled.open[section] & ~compiled.blocked[faculty_id], length))
+        rooms = np.flatnonzero(compiled.lab_room[row])
+        count = len(rooms) * len(days)
+        parts.append((np.full(count, row), np.tile(days, len(rooms)), np.tile(slots, len(rooms)),
+                      new_vars(count), np.repeat(rooms, len(days))))
+    labs = table(compiled.labs, parts, columns=5)
+    lab_length = compiled.lab_slots[labs.row].astype(np.int64)
+
+    # Rooms as resources: an optional interval per lab var over the week's
+    # slots (runs never cross a day), no overlap in a single room, at most
+    # `capacity` sessions at once in a larger one
+    for room, group in zip(*_groups(labs.room, np.arange(len(labs.var)))):
+        capacity = int(compiled.room_capacity[room])
+        if len(group) <= capacity:
+            continue
+        intervals = [model.new_optional_fixed_size_interval_var(int(labs.day[i] * n_slots + labs.slot[i]),
+                                                                int(lab_length[i]), variables[labs.var[i]], "")
+                     for i in group.tolist()]
+        if capacity == 1:
+            model.add_no_overlap(intervals)
+        else:
+            model.add_cumulative(intervals, [1] * len(intervals), capacity)
+
+    # At most one lab session per section per day
+    for group in _groups(labs.section * n_days + labs.day, labs.var)[1]:
+        if len(group) > 1:
+            model.add_at_most_one(literals(group))
+
+    # Each lab session is assigned exactly once per week per section
+    rows, groups = _groups(labs.row, labs.var)
+    for row, group in zip(rows, groups):
+        requirements[requirement_key("lab", compiled.labs, row)] = model.add_exactly_one(literals(group))
+
+    # Every (section, day, slot) a lab var covers, keyed section * days * slots + day * slots + slot
+    def cell_key(section, day, slot):
+        return (section * n_days + day) * n_slots + slot
+
+    cover = np.repeat(np.arange(len(labs.var)), lab_length)
+    offset = np.arange(len(cover)) - np.repeat(np.cumsum(lab_length) - lab_length, lab_length)
+    lab_cover_key = cell_key(labs.section[cover], labs.day[cover], labs.slot[cover] + offset)
+    lab_cover_var = labs.var[cover]
+    lab_cover_row = labs.row[cover]
+
+    # Step 2: Weekly Once subjects for the section's year. Each one gets a
+    # variable per open slot and the solver places it on exactly one of them
+    parts = []
+    for row, (section, subject) in enumerate(compiled.weekly):
+        days, slots = np.nonzero(compiled.open[section])
+        if not len(days):
+            logger.warning("No available slot for Weekly Once %s in section %s",
+                           compiled.subjects[subject], compiled.sections[section])
+            continue
+        var = new_vars(len(days))
+        parts.append((np.full(len(days), row), days, slots, var))
+        requirements[requirement_key("weekly", compiled.weekly, row)] = model.add_exactly_one(literals(var))
+    weekly = table(compiled.weekly, parts)
+    weekly_key = cell_key(weekly.section, weekly.day, weekly.slot)
+
+    # Step 3: Regular subjects. A slot covered by the subject's own lab counts
+    # through the lab var; every other open slot the teacher can take gets
+    # a var of its own
+    lab_row = {(section, subject): row for row, (section, subject, _) in enumerate(compiled.labs)}
+    cover_rows, cover_groups = _groups(lab_cover_row, np.arange(len(lab_cover_row)))
+    cover_of = dict(zip(cover_rows.tolist(), cover_groups))
+    lab_rows, lab_groups = _groups(labs.row, np.arange(len(labs.var)))
+    lab_vars = dict(zip(lab_rows.tolist(), lab_groups))  # lab row -> positions in `labs`
+    parts = []
+    faculty_cells, subject_days = [], []  # (faculty, day, slot, var) and (row, day, var) entries
+    for row, (section, subject, faculty_id) in enumerate(compiled.regular):
+        cover = cover_of.get(lab_row.get((section, subject)), np.zeros(0, dtype=np.int64))
+        cover_cell = lab_cover_key[cover] % (n_days * n_slots)
+        covered = np.zeros(n_days * n_slots, dtype=bool)
+        covered[cover_cell] = True
+        free = (compiled.open[section] & ~compiled.blocked[faculty_id]).ravel() & ~covered
+        cells = np.flatnonzero(free)
+        var = new_vars(len(cells))
+        parts.append((np.full(len(cells), row), cells // n_slots, cells % n_slots, var))
+
+        entry_cell = np.concatenate([cells, cover_cell])
+        entry_var = np.concatenate([var, lab_cover_var[cover]])
+        subject_days.append((np.full(len(entry_cell), row), entry_cell // n_slots, entry_var))
+        if faculty_id >= 0:
+            faculty_cells.append((np.full(len(entry_cell), faculty_id), entry_cell // n_slots,
+                                  entry_cell % n_slots, entry_var))
+
+        # No subject more than 2 slots per day, a lab counting as its length
+        # (up to the 2): a long lab still fits on a day of its own
+        own = lab_vars.get(lab_row.get((section, subject)), np.zeros(0, dtype=np.int64))
+        day_var = np.concatenate([var, labs.var[own]])
+        weight = np.concatenate([np.ones(len(var), dtype=np.int64),
+                                 np.minimum(lab_length[own], MAX_PERIODS_PER_DAY)])
+        for group in _groups(np.concatenate([cells // n_slots, labs.day[own]]), np.arange(len(day_var)))[1]:
+            model.add(LinearExpr.weighted_sum(literals(day_var[group]), weight[group].tolist())
+                      <= MAX_PERIODS_PER_DAY)
+        # At most 5 theory slots per week, at least 5 slots with the lab's
+        if len(var) > MAX_THEORY_PER_WEEK:
+            model.add(LinearExpr.sum(literals(var)) <= MAX_THEORY_PER_WEEK)
+        if len(entry_var):
+            requirements[requirement_key("subject", compiled.regular, row)] = model.add(
+                LinearExpr.sum(literals(entry_var)) >= MIN_PERIODS_PER_WEEK)
+        else:
+            logger.warning("No available slots for %s in %s", compiled.subjects[subject], compiled.sections[section])
+    regular = table(compiled.regular, parts)
+
+    # At most one class (regular, lab or Weekly Once) per slot per section
+    keys = np.concatenate([cell_key(regular.section, regular.day, regular.slot), lab_cover_key, weekly_key])
+    vars_ = np.concatenate([regular.var, lab_cover_var, weekly.var])
+    for group in _groups(keys, vars_)[1]:
+        if len(group) > 1:
+            model.add_at_most_one(literals(group))
+
+    # Labs occupy their teacher for every slot they cover
+    cover_faculty = compiled.labs[lab_cover_row, 2]
+    cover_cell = lab_cover_key[cover_faculty >= 0] % (n_days * n_slots)
+    faculty_cells.append((cover_faculty[cover_faculty >= 0], cover_cell // n_slots, cover_cell % n_slots,
+                          lab_cover_var[cover_faculty >= 0]))
+    faculty_cells = tuple(_concat([part[i] for part in faculty_cells]) for i in range(4))
+
+    # Teachers' daily and weekly caps on the periods they teach
+    if (compiled.daily_cap >= 0).any() or (compiled.weekly_cap >= 0).any():
+        teacher_day, teacher_var = teacher_periods(faculty_cells, n_days, n_slots)
+        teacher_week = teacher_day - teacher_day % n_days
+        for caps, key in ((compiled.daily_cap, teacher_day), (compiled.weekly_cap, teacher_week)):
+            group_keys, groups = _groups(key, teacher_var)
+            for group_key, group in zip(group_keys.tolist(), groups):
+                cap = int(caps[group_key // n_days])
+                if 0 <= cap < len(group):
+                    model.add(LinearExpr.sum(literals(group)) <= cap)
+
+    return TimetableModel(
+        model=model,
+        compiled=compiled,
+        variables=variables,
+        labs=labs,
+        weekly=weekly,
+        regular=regular,
+        faculty_cells=faculty_cells,
+        section_cells=(keys, vars_),
+        subject_days=tuple(_concat([part[i] for part in subject_days]) for i in range(3)),
+        requirements=requirements,
+    )
+
+
+# Every period a var makes a teacher teach, as (faculty * days + day, var)
+# arrays: a lab var lists once per slot it covers, but a lab var also counted
+# through its subject's theory teacher lists once per period
+def teacher_periods(faculty_cells, n_days, n_slots):
+    faculty, day, slot, var = faculty_cells
+    keys, groups = _groups((faculty * n_days + day) * n_slots + slot, var, unique=True)
+    return np.repeat(keys // n_slots, [len(group) for group in groups]), _concat(groups)
+
+
+# Vars of every faculty member and period that more than one var could fill:
+# (faculty_id, day, slot, vars). A lab var taught by the same teacher as the
+# subject's theory is listed once.
+def faculty_slot_groups(timetable_model):
+    compiled = timetable_model.compiled
+    faculty, day, slot, var = timetable_model.faculty_cells
+    n_days, n_slots = len(compiled.days), len(compiled.slots)
+    keys, groups = _groups((faculty * n_days + day) * n_slots + slot, var, unique=True)
+    for key, group in zip(keys.tolist(), groups):
+        if len(group) > 1:
+            faculty_id, cell = divmod(key, n_days * n_slots)
+            yield (compiled.faculty[faculty_id], compiled.days[cell // n_slots], compiled.slots[cell % n_slots],
+                   [timetable_model.variables[i] for i in group])
+
+
+# Faculty clashes from the faculty cells: hard faculty get an AtMostOne per
+# slot; soft faculty get one excess counter per contested slot
+# (excess >= bookings - 1) that the objective drives to zero.
+def add_faculty_constraints(timetable_model, faculty_modes, default_mode="soft"):
+    model = timetable_model.model
+    for faculty_id, day, slot, slot_vars in faculty_slot_groups(timetable_model):
+        if faculty_modes.get(faculty_id, default_mode) == "hard":
+            model.add_at_most_one(slot_vars)
+        else:
+            excess = model.new_int_var(0, len(slot_vars) - 1, "")
+            model.add(LinearExpr.sum(slot_vars) - 1 <= excess)
+            timetable_model.penalty_vars.append(excess)
+
+
+# Schedule quality as weighted counters, each tied to the placement vars by
+# one linear inequality (counter >= excess) that the objective pulls down to
+# the true value; nothing is reified. With occupied(cell) the number of vars
+# filling a cell (0 or 1), and breaks and fixed activities counted as filled:
+#   gaps   - per open cell after an open cell: gap >= occupied(cell) - occupied(previous)
+#   spread - per subject and day: double >= classes - 1 (a lab is one class)
+#   free   - per section: free >= open cells - FREE_PERIODS_PER_WEEK - occupied cells
+#   load   - per teacher and day: excess >= periods - max_daily_load
+def add_soft_constraints(timetable_model, weights):
+    model, compiled = timetable_model.model, timetable_model.compiled
+    variables = timetable_model.variables
+    n_days, n_slots = len(compiled.days), len(compiled.slots)
+    terms = timetable_model.soft_terms
+
+    def occupied(indexes):
+        return LinearExpr.sum([variables[i] for i in indexes])
+
+    keys, groups = _groups(*timetable_model.section_cells)
+    cells = dict(zip(keys.tolist(), groups))
+
+    if weights.gaps:
+        # open[..., s] & open[..., s - 1]: both cells can hold a class
+        after_open = np.zeros_like(compiled.open)
+        after_open[:, :, 1:] = compiled.open[:, :, 1:] & compiled.open[:, :, :-1]
+        for cell in np.flatnonzero(after_open).tolist():
+            if cell in cells:
+                gap = model.new_bool_var("")
+                model.add(occupied(cells[cell]) - occupied(cells.get(cell - 1, ())) <= gap)
+                terms.append((weights.gaps, gap))
+
+    if weights.free:
+        open_cells = compiled.open.reshape(len(compiled.sections), -1).sum(axis=1)
+        by_section = {}
+        for cell, group in cells.items():
+            by_section.setdefault(cell // (n_days * n_slots), []).append(group)
+        for section, count in enumerate(open_cells.tolist()):
+            allowed = count - FREE_PERIODS_PER_WEEK
+            if allowed > 0:
+                free = model.new_int_var(0, allowed, "")
+                model.add(occupied(_concat(by_section.get(section, []))) + free >= allowed)
+                terms.append((weights.free, free))
+
+    if weights.spread:
+        # subject_days lists a lab var once per slot it covers; the lab is
+        # one class, and with the daily cap a day then holds at most two
+        row, day, var = timetable_model.subject_days
+        for group in _groups(row * n_days + day, var, unique=True)[1]:
+            if len(group) > 1:
+                double = model.new_bool_var("")
+                model.add(occupied(group) - 1 <= double)
+                terms.append((weights.spread, double))
+
+    if weights.load:
+        for group in _groups(*teacher_periods(timetable_model.faculty_cells, n_days, n_slots))[1]:
+            if len(group) > weights.max_daily_load:
+                excess = model.new_int_var(0, len(group) - weights.max_daily_load, "")
+                model.add(occupied(group) - weights.max_daily_load <= excess)
+                terms.append((weights.load, excess))
+
+
+def set_objective(timetable_model):
+    soft_weights = [weight for weight, _ in timetable_model.soft_terms]
+    soft_vars = [var for _, var in timetable_model.soft_terms]
+    timetable_model.model.minimize(timetable_model.penalty_weight * LinearExpr.sum(timetable_model.penalty_vars)
+                                   + LinearExpr.weighted_sum(soft_vars, soft_weights))
@@ -0,0 +1,265 @@
+import time
+from collections import deque
+from html import escape
+
+from ortools.sat.python import cp_model
+
+from model_builder import (MAX_PERIODS_PER_DAY, MIN_PERIODS_PER_WEEK, build_core, add_faculty_constraints,
+                           lab_capacity, lab_option)
+
+# Counting checks that prove a workbook cannot be scheduled, run before any
+# model is built. Each check is a necessary condition of the model in
+# model_builder.build_core(), so a workbook that fails one is infeasible and
+# a workbook that passes them all may still be. A conflict is a dict:
+#   {"kind": ..., "key": ..., "message": ..., "need": ..., "have": ...}
+
+
+def _conflict(kind, key, message, need=None, have=None):
+    return {"kind": kind, "key": key, "message": message, "need": need, "have": have}
+
+
+def _subject_name(problem, subject_id):
+    return f"{problem.subject_dict.get(subject_id, 'Unknown Subject')} ({subject_id})"
+
+
+# (day, slot) of every period a section can hold a class in: no break and
+# no fixed activity
+def open_slots(problem, section):
+    fixed = problem.fixed_activities.get(section, {})
+    return {day: [slot for slot in problem.all_slots
+                  if slot not in problem.break_slots and slot not in fixed.get(day, {})]
+            for day in problem.days}
+
+
+# Largest flow from source to sink over edges {node: {next: capacity}}:
+# shortest augmenting paths a phase at a time (Dinic, Hopcroft-Karp on
+# bipartite graphs), walked with explicit stacks so a large workbook cannot
+# exhaust the recursion limit
+def _max_flow(edges, source, sink):
+    residual = {source: {}}
+    for node, targets in edges.items():
+        for target, capacity in targets.items():
+            residual.setdefault(node, {})[target] = residual.get(node, {}).get(target, 0) + capacity
+            residual.setdefault(target, {}).setdefault(node, 0)
+    flow = 0
+    while True:
+        level = {source: 0}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for target, capacity in residual[node].items():
+                if capacity and target not in level:
+                    level[target] = level[node] + 1
+                    queue.append(target)
+        if sink not in level:
+            return flow
+        pending = {node: list(targets) for node, targets in residual.items() if node in level}
+        path = [source]
+        while path:
+            node = path[-1]
+            if node == sink:
+                push = min(residual[u][v] for u, v in zip(path, path[1:]))
+                for u, v in zip(path, path[1:]):
+                    residual[u][v] -= push
+                    residual[v][u] += push
+                flow += push
+                path = [source]
+                continue
+            targets = pending[node]
+            while targets and not (residual[node][targets[-1]] and level.get(targets[-1]) == level[node] + 1):
+                targets.pop()
+            if targets:
+                path.append(targets[-1])
+            else:
+                level.pop(node)  # Dead end for the rest of the phase
+                path.pop()
+
+
+# Most lab sessions that can each get a room and a start, given as
+# {(rooms, starts): sessions with exactly those options}. A (room, day, first
+# slot) holds the room's capacity in sessions: more starting together would
+# overlap. Sessions reach it through their room list, so the graph grows with
+# the distinct option sets, not with every session, room place or pair.
+def _max_labs(problem, groups):
+    unbounded = sum(groups.values())
+    edges = {"source": {}}
+    for (rooms, starts), count in groups.items():
+        edges["source"][("labs", rooms, starts)] = count
+        edges[("labs", rooms, starts)] = {("rooms", rooms, start): count for start in starts}
+        for start in starts:
+            edges[("rooms", rooms, start)] = {("room", room, start): unbounded for room in rooms}
+            for room in rooms:
+                edges[("room", room, start)] = {"sink": lab_capacity(problem, room)}
+    return _max_flow(edges, "source", "sink")
+
+
+def check_problem(problem, faculty_mode="soft"):
+    conflicts = []
+    teaching_slots = [slot for slot in problem.all_slots if slot not in problem.break_slots]
+    faculty_need = {}  # faculty_id -> periods they must teach
+    lab_groups = {}  # (rooms, starts) -> lab sessions with those options
+
+    def hard(faculty_id):
+        return faculty_id and problem.faculty_modes.get(faculty_id, faculty_mode) == "hard"
+
+    for section in problem.sections:
+        open_by_day = open_slots(problem, section)
+        open_sets = {day: set(slots) for day, slots in open_by_day.items()}
+        subjects = {}
+        for subject_id, faculty_id in problem.section_subject_mapping.get(section, []):
+            subjects.setdefault(subject_id, faculty_id)
+        weekly = problem.weekly_once_by_year.get(section.split("_")[0], [])
+
+        # Regular and Weekly Once subjects share the section's open periods
+        need = MIN_PERIODS_PER_WEEK * len(subjects) + len(weekly)
+        have = sum(len(slots) for slots in open_by_day.values())
+        if need > have:
+            conflicts.append(_conflict(
+                "section", section,
+                f"{section} needs {need} periods a week ({len(subjects)} subjects x {MIN_PERIODS_PER_WEEK}"
+                f" + {len(weekly)} weekly once) but only {have} are free of breaks and fixed activities",
+                need, have))
+
+        # Labs need their run of consecutive open periods, at most one lab a day
+        lab_cover = {}
+        lab_extra = {}  # subject_id -> periods its lab adds over the daily limit
+        lab_days = set()
+        labs = problem.section_lab_mapping.get(section, [])
+        for subject_id, faculty_id in labs:
+            length, rooms = lab_option(problem, section, subject_id)
+            blocked = problem.faculty_blocked.get(faculty_id, ())
+            candidates = [(day, problem.all_slots[i:i + length]) for day in problem.days
+                          for i in range(len(problem.all_slots) - length + 1)
+                          if all(slot in open_sets[day] and (day, slot) not in blocked
+                                 for slot in problem.all_slots[i:i + length])]
+            if not candidates:
+                conflicts.append(_conflict(
+                    "lab", f"{section}/{subject_id}",
+                    f"{_subject_name(problem, subject_id)} lab of {section} has no {length} consecutive free periods",
+                    1, 0))
+                continue
+            options = (tuple(rooms), tuple((day, slots[0]) for day, slots in candidates))
+            lab_groups[options] = lab_groups.get(options, 0) + 1
+            lab_days.update(day for day, _ in candidates)
+            lab_extra[subject_id] = max(0, length - MAX_PERIODS_PER_DAY)
+            cover = lab_cover.setdefault(subject_id, set())
+            for day, slots in candidates:
+                cover.update((day, slot) for slot in slots)
+            if faculty_id and subjects.get(subject_id) != faculty_id:
+                faculty_need[faculty_id] = faculty_need.get(faculty_id, 0) + length
+        if len(labs) > len(lab_days):
+            conflicts.append(_conflict(
+                "section_labs", section,
+                f"{section} has {len(labs)} labs but at most one lab a day fits, on {len(lab_days)} days",
+                len(labs), len(lab_days)))
+
+        # Each subject needs its weekly periods within the daily limit
+        for subject_id, faculty_id in subjects.items():
+            blocked = problem.faculty_blocked.get(faculty_id, ())
+            cover = lab_cover.get(subject_id, ())
+            have = sum(min(MAX_PERIODS_PER_DAY,
+                           sum(1 for slot in open_by_day[day] if (day, slot) in cover or (day, slot) not in blocked))
+                       for day in problem.days) + lab_extra.get(subject_id, 0)
+            if have < MIN_PERIODS_PER_WEEK:
+                conflicts.append(_conflict(
+                    "subject", f"{section}/{subject_id}",
+                    f"{_subject_name(problem, subject_id)} in {section} needs {MIN_PERIODS_PER_WEEK} periods a week"
+                    f" but can get at most {have} ({MAX_PERIODS_PER_DAY} a day on its free periods)",
+                    MIN_PERIODS_PER_WEEK, have))
+            if faculty_id:
+                faculty_need[faculty_id] = faculty_need.get(faculty_id, 0) + MIN_PERIODS_PER_WEEK
+
+    sessions = sum(lab_groups.values())
+    placed = _max_labs(problem, lab_groups)
+    if placed < sessions:
+        conflicts.append(_conflict(
+            "lab_pool", "labs",
+            f"{sessions} lab sessions need a lab room but only {placed}"
+            f" can get one (each room holds its capacity in sessions at a time)",
+            sessions, placed))
+
+    # A teacher cannot teach more periods than their caps allow, nor, if they
+    # may not be double-booked, more than the periods they are available
+    for faculty_id, need in faculty_need.items():
+        per_day, per_week = problem.faculty_limits.get(faculty_id, (None, None))
+        if not hard(faculty_id) and per_day is None and per_week is None:
+            continue
+        blocked = problem.faculty_blocked.get(faculty_id, ())
+        have = 0
+        for day in problem.days:
+            available = sum(1 for slot in teaching_slots if (day, slot) not in blocked)
+            if not hard(faculty_id) and available:
+                available = need  # Soft faculty may teach any number of classes at once
+            have += available if per_day is None else min(available, per_day)
+        if per_week is not None:
+            have = min(have, per_week)
+        if need > have:
+            limited = " within their load limits" if (per_day, per_week) != (None, None) else ""
+            conflicts.append(_conflict(
+                "faculty", str(faculty_id),
+                f"Faculty {faculty_id} must teach {need} periods a week but only {have} are available{limited}",
+                need, have))
+    return conflicts
+
+
+def _requirement_conflict(problem, key):
+    kind, section, subject_id = key
+    name = _subject_name(problem, subject_id)
+    message = {
+        "subject": f"{name} needs {MIN_PERIODS_PER_WEEK} periods a week in {section}",
+        "lab": f"{name} lab needs a room and consecutive periods in {section}",
+        "weekly": f"{name} (weekly once) needs a period in {section}",
+    }[kind]
+    return _conflict("requirement", f"{section}/{subject_id}", message)
+
+
+# Requirements (weekly periods, labs, Weekly Once placements) that cannot all
+# be met together. Each one is enforced by an assumption literal; CP-SAT
+# returns a core of them, which is shrunk by dropping one requirement at a
+# time while the rest stay infeasible. Bounded by settings.max_time overall;
+# if time runs out the core is returned as it is (infeasible, maybe not minimal).
+def explain_infeasible(problem, settings):
+    timetable_model = build_core(problem)
+    add_faculty_constraints(timetable_model, problem.faculty_modes, settings.faculty_mode)
+    model = timetable_model.model
+    literals = {}
+    for key, constraint in timetable_model.requirements.items():
+        literal = model.new_bool_var(f"require_{'_'.join(map(str, key))}")
+        constraint.only_enforce_if(literal)
+        literals[key] = literal
+    deadline = time.monotonic() + settings.max_time
+
+    def core_of(keys):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        model.clear_assumptions()
+        model.add_assumptions([literals[key] for key in keys])
+        solver = cp_model.CpSolver()
+        solver.parameters.num_workers = 1  # assumption cores come from the single-thread search
+        solver.parameters.max_time_in_seconds = remaining
+        solver.parameters.random_seed = settings.random_seed
+        if solver.solve(model) != cp_model.INFEASIBLE:
+            return None
+        core = set(solver.sufficient_assumptions_for_infeasibility())
+        return [key for key in keys if literals[key].index in core]
+
+    keys = core_of(list(literals))
+    if not keys:
+        return []
+    for key in list(keys):
+        if key not in keys:
+            continue  # Already dropped with an earlier, smaller core
+        smaller = core_of([k for k in keys if k != key])
+        if smaller is not None:
+            keys = smaller
+        elif time.monotonic() >= deadline:
+            break
+    return [_requirement_conflict(problem, key) for key in keys]
+
+
+def conflicts_html(conflicts):
+    if not conflicts:
+        return ""
+    return ("<ul class=\"text-danger\">"
+            + "".join(f"<li>{escape(conflict['message'])}</li>" for conflict in conflicts) + "</ul>")
@@ -0,0 +1,189 @@
+import csv
+import io
+import re
+from dataclasses import dataclass, field
+from html import escape
+
+# pandas and openpyxl are imported where a timetable is rendered: web workers
+# import this module to hold results and only load them for the first page
+# or export they serve.
+
+CSV_COLUMNS = ("section", "day", "slot", "label", "kind", "subject_id", "faculty_id", "room")
+
+# Labels of cells that hold no class
+BREAK_LABELS = ("Break", "Lunch")
+FREE_LABELS = ("Free", "Free Period")
+# Label of an open period the solver left empty
+FREE_PERIOD = "Free Period"
+
+
+# Label -> (kind, subject_id, faculty_id) for every class a section can hold
+def label_index(problem, section):
+    index = {}
+    for subject_id, faculty_id in problem.section_lab_mapping.get(section, []):
+        index[f"{problem.subject_dict.get(subject_id, 'Unknown Lab')} (Lab)"] = ("lab", subject_id, faculty_id)
+    for subject_id, faculty_id in problem.section_subject_mapping.get(section, []):
+        index.setdefault(problem.subject_dict.get(subject_id, "Unknown Subject"), ("theory", subject_id, faculty_id))
+    for subject_id in problem.weekly_once_by_year.get(section.split("_")[0], []):
+        index.setdefault(problem.subject_dict.get(subject_id, "Unknown Weekly Once"), ("weekly", subject_id, None))
+    return index
+
+
+# A solved timetable as data: one cell per (section, day, slot), section by
+# section in day/slot order. Exports and HTML are produced from it on demand.
+@dataclass
+class TimetableResult:
+    days: list
+    slots: list
+    sections: list
+    cells: list = field(default_factory=list)  # (section, day, slot, label, kind, subject_id, faculty_id, room)
+    _indexes: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    # rooms maps (section, subject_id) to the room of each solved lab session
+    @classmethod
+    def from_frames(cls, problem, timetable_dict, rooms=None):
+        rooms = rooms or {}
+        days, slots = [], []
+        cells = []
+        for section, df in timetable_dict.items():
+            days, slots = df.index.tolist(), df.columns.tolist()
+            index = label_index(problem, section)
+            fixed = problem.fixed_activities.get(section, {})
+            for day, labels in zip(days, df.to_numpy(dtype=object).tolist()):
+                for slot, label in zip(slots, labels):
+                    if label in BREAK_LABELS:
+                        kind, subject_id, faculty_id = "break", None, None
+                    elif fixed.get(day, {}).get(slot) == label:
+                        kind, subject_id, faculty_id = "fixed", None, None
+                    elif label in FREE_LABELS:
+                        kind, subject_id, faculty_id = "free", None, None
+                    else:
+                        kind, subject_id, faculty_id = index.get(label, ("other", None, None))
+                    room = rooms.get((section, subject_id)) if kind == "lab" else None
+                    cells.append((section, day, slot, label, kind, subject_id, faculty_id, room))
+        return cls(days=days, slots=slots, sections=list(timetable_dict), cells=cells)
+
+    def _section_cells(self, section):
+        size = len(self.days) * len(self.slots)
+        start = self.sections.index(section) * size
+        return self.cells[start:start + size]
+
+    def section_frame(self, section):
+        import pandas as pd
+
+        labels = [cell[3] for cell in self._section_cells(section)]
+        width = len(self.slots)
+        return pd.DataFrame([labels[d * width:(d + 1) * width] for d in range(len(self.days))],
+                            index=self.days, columns=self.slots, dtype=object)
+
+    # Cell positions by faculty and by lab room, built in one pass on first
+    # use so every later lookup is a dict access. Keys are strings, as in
+    # URLs. A lab in its default room (named after the subject ID), or from
+    # before rooms were recorded, is listed under its subject's name.
+    def index(self, view):
+        if not self._indexes:
+            by_faculty, by_lab, lab_names = {}, {}, {}
+            for i, (_, _, _, label, kind, subject_id, faculty_id, *room) in enumerate(self.cells):
+                if faculty_id:
+                    by_faculty.setdefault(str(faculty_id), []).append(i)
+                if kind == "lab":
+                    room = room[0] if room and room[0] is not None else str(subject_id)
+                    by_lab.setdefault(room, []).append(i)
+                    if room != str(subject_id):
+                        lab_names[room] = room
+                    else:
+                        lab_names[room] = label[:-len(" (Lab)")] if label.endswith(" (Lab)") else label
+            self._indexes.update(faculty=by_faculty, lab=by_lab, lab_names=lab_names)
+        return self._indexes[view]
+
+    # Weekly grid of one faculty member or lab: one row per day, one list of
+    # (section, label) per slot. Empty when the key has no classes.
+    def schedule(self, view, key, days=None):
+        days = self.days if days is None else days
+        rows = {day: [[] for _ in self.slots] for day in days}
+        slot_pos = {slot: i for i, slot in enumerate(self.slots)}
+        for i in self.index(view).get(str(key), []):
+            section, day, slot, label = self.cells[i][:4]
+            if day in rows:
+                rows[day][slot_pos[slot]].append((section, label))
+        return rows
+
+    def schedule_html(self, view, key, days=None):
+        import pandas as pd
+
+        rows = self.schedule(view, key, days)
+        frame = pd.DataFrame(
+            [["<br>".join(f"{escape(section)}: {escape(label)}" for section, label in entries) for entries in row]
+             for row in rows.values()],
+            index=list(rows), columns=self.slots, dtype=object)
+        title = self.index("lab_names").get(str(key), key) if view == "lab" else key
+        return (f"<h2>{'Lab' if view == 'lab' else 'Faculty'} timetable for {escape(str(title))}</h2>\n"
+                + frame.to_html(classes="table table-bordered", escape=False) + "<br><br>")
+
+    def records(self):
+        return [dict(zip(CSV_COLUMNS, cell)) for cell in self.cells]
+
+    def to_dict(self):
+        return {"days": self.days, "slots": self.slots, "sections": self.sections, "cells": self.records()}
+
+    # CSV text in chunks of rows, so large timetables can be streamed
+    def iter_csv(self, rows_per_chunk=1000):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        for i, cell in enumerate(self.cells, 1):
+            writer.writerow(cell)
+            if i % rows_per_chunk == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    # One sheet per section (Days x Slots), written row by row in
+    # openpyxl's write-only mode
+    def write_xlsx(self, out):
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        used = set()
+        for section in self.sections:
+            sheet = workbook.create_sheet(_sheet_title(section, used))
+            sheet.append(["Day"] + self.slots)
+            cells = self._section_cells(section)
+            for d, day in enumerate(self.days):
+                row = cells[d * len(self.slots):(d + 1) * len(self.slots)]
+                sheet.append([day] + [cell[3] for cell in row])
+        workbook.save(out)
+
+    def section_html(self, section):
+        return (f"<h2>Timetable for {escape(section)}</h2>\n"
+                + self.section_frame(section).to_html(classes="table table-bordered") + "<br><br>")
+
+    # One page of sections with links to the other pages and to each
+    # section. page_url(page=..., section=...) builds the link targets.
+    def page_html(self, page, per_page, page_url):
+        pages = max(1, -(-len(self.sections) // per_page))
+        page = min(max(page, 1), pages)
+        shown = self.sections[(page - 1) * per_page:page * per_page]
+
+        nav = ""
+        if pages > 1:
+            nav = '<nav><ul class="pagination pagination-sm flex-wrap">' + "".join(
+                f'<li class="page-item{" active" if p == page else ""}">'
+                f'<a class="page-link" data-fragment href="{escape(page_url(page=p))}">{p}</a></li>'
+                for p in range(1, pages + 1)) + "</ul></nav>"
+        jump = '<p class="small">Sections: ' + " &middot; ".join(
+            f'<a data-fragment href="{escape(page_url(section=section))}">{escape(section)}</a>'
+            for section in self.sections) + "</p>"
+        return jump + nav + "".join(self.section_html(section) for section in shown) + nav
+
+
+# Excel sheet titles: at most 31 characters, no []:*?/\ and unique
+def _sheet_title(name, used):
+    title = re.sub(r"[\[\]:*?/\\]", "_", name)[:31] or "Sheet"
+    base, n = title, 1
+    while title in used:
+        n += 1
+        title = f"{base[:31 - len(str(n)) - 1]}~{n}"
+    used.add(title)
+    return title
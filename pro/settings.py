@@ -0,0 +1,160 @@
+import os
+from dataclasses import dataclass, asdict, fields, replace
+
+# Solver settings and their parsing from the environment and from requests.
+# Only the standard library is imported here: the web tier validates
+# settings without loading the solver (see solver.py and model_builder.py).
+
+# How a faculty member double-booked in one slot is handled:
+#   hard - never allowed (AtMostOne per faculty and slot)
+#   soft - allowed, each extra booking costs penalty_weight in the objective
+FACULTY_MODES = ("soft", "hard")
+
+
+# Objective cost of one unit of each soft-constraint counter. A faculty clash
+# costs TimetableModel.penalty_weight, more than any one default here, but a
+# single move can change several counters at once and the weights can be
+# raised per request, so in soft faculty mode better schedule quality can
+# outweigh a double booking; hard mode rules them out. A zero weight leaves
+# its counter out.
+@dataclass
+class SoftWeights:
+    gaps: int = 2            # a class that follows a free period on the same day
+    spread: int = 1          # a day a subject takes two periods instead of one
+    free: int = 1            # a free period beyond model_builder.FREE_PERIODS_PER_WEEK a week
+    load: int = 1            # a period a teacher teaches beyond max_daily_load in a day
+    max_daily_load: int = 6
+
+
+# A lone CP-SAT worker runs only its LP-guided search, which is slow to find
+# a first timetable once the objective carries the soft constraints; a second
+# worker adds the feasibility-first strategies. Two threads share one core
+# fine. Used for num_workers=0 and the deployment default; an explicit
+# num_workers is kept as it is.
+MIN_SEARCH_WORKERS = 2
+
+# Wall-clock limit of a deterministic search, as a multiple of max_time
+DETERMINISTIC_WALL_SLACK = 4
+
+
+@dataclass
+class SolverSettings:
+    num_workers: int = 0            # CP-SAT search workers, 0 = one per core (at least MIN_SEARCH_WORKERS)
+    max_time: float = 60.0          # seconds before the search is stopped
+    relative_gap: float = 0.0       # stop once within this fraction of the bound
+    random_seed: int = 0
+    deterministic: bool = False     # reproducible search: same workbook + seed gives the same timetable
+    return_best_feasible: bool = True  # keep the best timetable found when time runs out
+    decompose: bool = False         # solve independent groups of sections in parallel
+    faculty_mode: str = "soft"      # faculty clashes: "soft" (penalised) or "hard" (forbidden)
+    explain: bool = False           # when infeasible, find a minimal set of requirements that conflict
+    # Objective weights of the soft constraints (see SoftWeights); 0 turns one off
+    gap_weight: int = 2             # a class after a free period on the same day
+    spread_weight: int = 1          # a day a subject takes two periods
+    free_weight: int = 1            # a free period beyond one a week per section
+    load_weight: int = 1            # a period beyond max_daily_load for a teacher in a day
+    max_daily_load: int = 6
+
+    def apply(self, solver):
+        params = solver.parameters
+        params.num_workers = self.num_workers or self.worker_budget()
+        params.max_time_in_seconds = self.max_time
+        params.relative_gap_limit = self.relative_gap
+        params.random_seed = self.random_seed
+        if self.deterministic:
+            # Interleaved workers and a deterministic time budget make the
+            # search independent of thread timing and machine load. The
+            # wall-clock limit stays only as a backstop well past the
+            # budget; a host so loaded that it hits it gets whatever
+            # timetable was found by then.
+            params.interleave_search = True
+            params.max_deterministic_time = self.max_time
+            params.max_time_in_seconds = self.max_time * DETERMINISTIC_WALL_SLACK
+
+    # Search workers this solve may use in all
+    def worker_budget(self):
+        return self.num_workers or max(os.cpu_count() or 1, MIN_SEARCH_WORKERS)
+
+    # Processes and per-process settings for `parts` solved side by side:
+    # each process gets MIN_SEARCH_WORKERS where the budget allows, and
+    # together they use no more than the budget
+    def split(self, parts):
+        budget = self.worker_budget()
+        processes = max(1, min(parts, budget // MIN_SEARCH_WORKERS))
+        return processes, replace(self, num_workers=budget // processes)
+
+    def as_dict(self):
+        return asdict(self)
+
+    def soft_weights(self):
+        return SoftWeights(gaps=self.gap_weight, spread=self.spread_weight, free=self.free_weight,
+                           load=self.load_weight, max_daily_load=self.max_daily_load)
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _coerce(name, value):
+    kind = {f.name: f.type for f in fields(SolverSettings)}[name]
+    if kind in (bool, "bool"):
+        return _parse_bool(value)
+    if kind in (int, "int"):
+        return int(value)
+    if kind in (str, "str"):
+        return str(value).strip().lower()
+    return float(value)
+
+
+# Deployment defaults from the environment (SOLVER_NUM_WORKERS, SOLVER_MAX_TIME, ...)
+def settings_from_env(environ=None, default_workers=None):
+    environ = os.environ if environ is None else environ
+    values = {}
+    if default_workers is not None:
+        values["num_workers"] = default_workers
+    for f in fields(SolverSettings):
+        raw = environ.get(f"SOLVER_{f.name.upper()}")
+        if raw not in (None, ""):
+            values[f.name] = _coerce(f.name, raw)
+    return SolverSettings(**values)
+
+
+# Per-request overrides on top of the deployment defaults. max_time and
+# num_workers can only be lowered so one request cannot monopolise a host.
+def settings_from_request(args, defaults):
+    values = defaults.as_dict()
+    for f in fields(SolverSettings):
+        raw = args.get(f.name)
+        if raw in (None, ""):
+            continue
+        try:
+            values[f.name] = _coerce(f.name, raw)
+        except ValueError:
+            raise ValueError(f"Invalid value for {f.name}: {raw!r}")
+    if values["max_time"] <= 0 or values["relative_gap"] < 0 or values["num_workers"] < 0:
+        raise ValueError("max_time must be positive; relative_gap and num_workers cannot be negative")
+    if any(values[name] < 0 for name in ("gap_weight", "spread_weight", "free_weight", "load_weight")) \
+            or values["max_daily_load"] < 1:
+        raise ValueError("Soft-constraint weights cannot be negative and max_daily_load must be at least 1")
+    if values["faculty_mode"] not in FACULTY_MODES:
+        raise ValueError(f"faculty_mode must be one of {', '.join(FACULTY_MODES)}")
+    values["max_time"] = min(values["max_time"], defaults.max_time)
+    if defaults.num_workers:
+        values["num_workers"] = min(values["num_workers"] or defaults.num_workers, defaults.num_workers)
+    return SolverSettings(**values)
+
+
+def stats_html(settings, stats):
+    return (
+        '<p class="text-muted small">'
+        f"Solver: {stats['status']} in {stats['wall_time']}s"
+        f" &middot; objective {stats['objective']} (bound {stats['best_bound']})"
+        f" &middot; {stats['branches']} branches, {stats['conflicts']} conflicts"
+        f" &middot; {settings.num_workers or 'all'} workers, limit {settings.max_time}s,"
+        f" gap {settings.relative_gap}, seed {settings.random_seed}, {settings.faculty_mode} faculty clashes"
+        + (f" &middot; {stats['components']} independent parts" if stats.get("components") else "")
+        + (" &middot; stopped early" if stats.get("stopped") else "")
+        + "</p>"
+    )
@@ -0,0 +1,66 @@
+import posixpath
+import zipfile
+from xml.etree import ElementTree
+
+# The sheets a workbook must and may have, and a check of its sheet names
+# read from the xlsx package itself. The web tier rejects an upload with it
+# before storing or queueing anything, without loading pandas or openpyxl;
+# loader.py checks the columns when the solver reads the workbook.
+
+# Sheets the solver needs and the columns each one must provide
+REQUIRED_SHEETS = {
+    "Sections Data": ["Year", "Department", "Section"],
+    "Subjects Data": ["Subject ID", "Subject Name"],
+    "Teachers Data": [],
+    "Time Slot Data": ["Slot ID"],
+    "Section Subjects Data": ["Year", "Department", "Section", "Subject ID", "Faculty ID"],
+    "Fixed Activities": ["Year", "Department", "Section", "Day", "Slot ID", "Activity"],
+    "Lab Sessions": ["Year", "Department", "Section", "Subject ID", "Faculty ID"],
+    "WeeklyOnce Subjects": ["Year", "Subject ID"],
+    "Target Subjects": ["Target Subjects"],
+}
+
+# Sheets a workbook may add, read and checked only when present
+OPTIONAL_SHEETS = {
+    "Lab Rooms": ["Room"],
+}
+
+OFFICE_DOCUMENT = "/officeDocument"
+
+
+class WorkbookError(ValueError):
+    pass
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+# Sheet names of an xlsx workbook (a seekable binary stream), in workbook
+# order. Only the package relationships and the workbook part are parsed.
+def sheet_names(stream):
+    try:
+        with zipfile.ZipFile(stream) as package:
+            part = "xl/workbook.xml"
+            if "_rels/.rels" in package.namelist():
+                for rel in ElementTree.fromstring(package.read("_rels/.rels")):
+                    if rel.get("Type", "").endswith(OFFICE_DOCUMENT):
+                        part = posixpath.normpath(rel.get("Target", part).lstrip("/"))
+                        break
+            root = ElementTree.fromstring(package.read(part))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise WorkbookError(f"Could not read workbook: {e}") from e
+    return [element.get("name") for element in root.iter() if _local(element.tag) == "sheet"]
+
+
+# Raise WorkbookError, as loader.validate_frames() would, when a required
+# sheet is missing; leaves the stream where it was
+def check_sheets(stream):
+    position = stream.tell()
+    try:
+        names = set(sheet_names(stream))
+    finally:
+        stream.seek(position)
+    missing = [sheet for sheet in REQUIRED_SHEETS if sheet not in names]
+    if missing:
+        raise WorkbookError("Invalid workbook: " + "; ".join(f"missing sheet '{sheet}'" for sheet in missing))
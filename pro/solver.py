@@ -0,0 +1,76 @@
+import threading
+import time
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+
+def solver_stats(solver, status):
+    return {
+        "status": solver.status_name(status),
+        "wall_time": round(solver.wall_time, 3),
+        "user_time": round(solver.user_time, 3),
+        "branches": solver.num_branches,
+        "conflicts": solver.num_conflicts,
+        "objective": solver.objective_value if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None,
+        "best_bound": solver.best_objective_bound,
+    }
+
+
+# Seconds between checks for a user's request to stop the search
+STOP_POLL_INTERVAL = 0.25
+
+
+# Reports improving solutions while CP-SAT searches. on_solution(info, values)
+# gets objective, bound, elapsed time and solution count plus every variable
+# value; calls are throttled to one per min_interval seconds.
+class SolutionReporter(cp_model.CpSolverSolutionCallback):
+    def __init__(self, on_solution, min_interval=1.0):
+        super().__init__()
+        self.on_solution = on_solution
+        self.min_interval = min_interval
+        self.solutions = 0
+        self._last = None
+
+    def on_solution_callback(self):
+        self.solutions += 1
+        now = time.monotonic()
+        if self._last is not None and now - self._last < self.min_interval:
+            return
+        self._last = now
+        info = {
+            "objective": self.objective_value,
+            "bound": self.best_objective_bound,
+            "elapsed": round(self.wall_time, 3),
+            "solutions": self.solutions,
+        }
+        self.on_solution(info, np.asarray(self.response_proto.solution, dtype=np.int8))
+
+
+# stop_requested() is polled during the search; once it returns True the
+# search ends with the best solution so far and stats["stopped"] is set
+def solve(model, settings, on_solution=None, stop_requested=None):
+    solver = cp_model.CpSolver()
+    settings.apply(solver)
+    callback = SolutionReporter(on_solution) if on_solution is not None else None
+
+    done = threading.Event()
+    stopped = threading.Event()
+
+    def watch():
+        while not done.wait(STOP_POLL_INTERVAL):
+            if stopped.is_set() or stop_requested():
+                stopped.set()
+                solver.stop_search()  # Repeated in case the search had not started yet
+
+    if stop_requested is not None:
+        threading.Thread(target=watch, name="solve-stop", daemon=True).start()
+    try:
+        status = solver.solve(model, callback)
+    finally:
+        done.set()
+
+    stats = solver_stats(solver, status)
+    if stopped.is_set():
+        stats["stopped"] = True
+    return solver, status, stats
@@ -1,2 +1,3 @@
 #!/bin/bash
-gunicorn app:app
+# Web worker settings (threads, preload) are in gunicorn.conf.py
+exec gunicorn app:app --config gunicorn.conf.py
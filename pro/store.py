@@ -0,0 +1,191 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from cache import CACHE_VERSION
+from jobs import FINISHED
+from result import CSV_COLUMNS, TimetableResult
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    job_id        TEXT PRIMARY KEY,
+    workbook_hash TEXT,
+    params        TEXT,   -- solver settings, JSON with sorted keys
+    status        TEXT NOT NULL,
+    solver        TEXT,   -- {"settings": ..., "stats": ...}
+    html          TEXT,
+    workbook      TEXT,
+    assignment    TEXT,
+    delta         TEXT,
+    layout        TEXT,   -- {"days": ..., "slots": ..., "sections": ...} of the timetable
+    created       REAL NOT NULL,
+    version       INTEGER  -- cache.CACHE_VERSION of the solver that made it
+);
+CREATE INDEX IF NOT EXISTS results_workbook ON results (workbook_hash, params);
+
+CREATE TABLE IF NOT EXISTS cells (
+    job_id     TEXT NOT NULL REFERENCES results (job_id) ON DELETE CASCADE,
+    section    TEXT NOT NULL,
+    day        TEXT NOT NULL,
+    slot,
+    label      TEXT,
+    kind       TEXT,
+    subject_id,
+    faculty_id TEXT,
+    room       TEXT
+);
+CREATE INDEX IF NOT EXISTS cells_section ON cells (job_id, section);
+CREATE INDEX IF NOT EXISTS cells_faculty ON cells (job_id, faculty_id);
+CREATE INDEX IF NOT EXISTS cells_day ON cells (job_id, day);
+
+-- Workbooks of a batch job, each one a stored job of its own
+CREATE TABLE IF NOT EXISTS batch_entries (
+    batch_id TEXT NOT NULL REFERENCES results (job_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name     TEXT,
+    status   TEXT,
+    job_id   TEXT,
+    PRIMARY KEY (batch_id, position)
+);
+"""
+
+
+def _dumps(value):
+    return None if value is None else json.dumps(value, sort_keys=True, default=str)
+
+
+def _loads(text):
+    return None if text is None else json.loads(text)
+
+
+# Finished job results in SQLite, so they outlive the process that solved
+# them and every web worker sharing the file can serve them. Timetable cells
+# are stored one row each and indexed by section, faculty and day.
+class ResultStore:
+    # The file and its schema are created on first use, not when the app
+    # is imported
+    def __init__(self, path):
+        self.path = path
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _setup(self):
+        with closing(self._open()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Stores from before lab rooms get the column, empty for old cells
+            if "room" not in {row[1] for row in conn.execute("PRAGMA table_info(cells)")}:
+                conn.execute("ALTER TABLE cells ADD COLUMN room TEXT")
+            # and results get the solver version, unknown (never reused) for old ones
+            if "version" not in {row[1] for row in conn.execute("PRAGMA table_info(results)")}:
+                conn.execute("ALTER TABLE results ADD COLUMN version INTEGER")
+
+    def _connect(self):
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    self._setup()
+                    self._ready = True
+        return self._open()
+
+    def save(self, job_id, result, created=None):
+        workbook = result.get("workbook")
+        settings = (result.get("solver") or {}).get("settings")
+        timetable = result.get("timetable")
+        layout = None
+        if timetable is not None:
+            layout = {"days": timetable.days, "slots": timetable.slots, "sections": timetable.sections}
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM results WHERE job_id = ?", (job_id,))
+            conn.execute(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id,
+                 os.path.splitext(os.path.basename(workbook))[0] if workbook else None,
+                 _dumps(settings), result["status"], _dumps(result.get("solver")), result.get("html"),
+                 workbook, _dumps(result.get("assignment")), _dumps(result.get("delta")), _dumps(layout),
+                 created or time.time(), CACHE_VERSION))
+            if timetable is not None:
+                conn.executemany("INSERT INTO cells VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 ((job_id,) + tuple(cell) for cell in timetable.cells))
+            conn.executemany("INSERT INTO batch_entries VALUES (?, ?, ?, ?, ?)",
+                             ((job_id, i, entry["name"], entry["status"], entry.get("job_id"))
+                              for i, entry in enumerate(result.get("batch") or [])))
+
+    # A stored job in the shape JobManager.get() returns, or None
+    def job(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT status, solver, html, workbook, assignment, delta, layout, created"
+                " FROM results WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            status, solver, html, workbook, assignment, delta, layout, created = row
+            result = {"status": status, "solver": _loads(solver), "html": html}
+            for name, value in (("workbook", workbook), ("assignment", _loads(assignment)), ("delta", _loads(delta))):
+                if value is not None:
+                    result[name] = value
+            if layout is not None:
+                cells = conn.execute(
+                    "SELECT section, day, slot, label, kind, subject_id, faculty_id, room"
+                    " FROM cells WHERE job_id = ? ORDER BY rowid", (job_id,)).fetchall()
+                result["timetable"] = TimetableResult(cells=cells, **_loads(layout))
+            entries = conn.execute(
+                "SELECT name, status, job_id FROM batch_entries WHERE batch_id = ? ORDER BY position",
+                (job_id,)).fetchall()
+            if entries:
+                result["batch"] = [{"name": name, "status": status, "job_id": entry_id}
+                                   for name, status, entry_id in entries]
+        return {
+            "id": job_id,
+            "status": FINISHED,
+            "progress": None,
+            "solution": None,
+            "updates": 0,
+            "created": created,
+            "started": created,
+            "finished": created,
+            "result": result,
+            "error": None,
+        }
+
+    # Cells of one stored job matching every given filter, via the indexes.
+    # None when the job is not stored.
+    def cells(self, job_id, section=None, faculty=None, day=None):
+        query = f"SELECT {', '.join(CSV_COLUMNS)} FROM cells WHERE job_id = ?"
+        args = [job_id]
+        for column, value in (("section", section), ("faculty_id", faculty), ("day", day)):
+            if value is not None:
+                query += f" AND {column} = ?"
+                args.append(value)
+        with closing(self._connect()) as conn:
+            if conn.execute("SELECT 1 FROM results WHERE job_id = ?", (job_id,)).fetchone() is None:
+                return None
+            rows = conn.execute(query + " ORDER BY rowid", args).fetchall()
+        return [dict(zip(CSV_COLUMNS, row)) for row in rows]
+
+    # Latest complete timetable for a workbook and solver settings, made by
+    # this solver version (never a re-solve, never one the user stopped
+    # early, and never a batch workbook solved around other workbooks'
+    # teachers)
+    def find(self, workbook_hash, params):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT job_id FROM results WHERE workbook_hash = ? AND params = ? AND version = ?"
+                " AND status = 'solved' AND delta IS NULL AND json_extract(solver, '$.stats.stopped') IS NULL"
+                " AND json_extract(solver, '$.stats.shared_faculty') IS NULL"
+                " ORDER BY created DESC LIMIT 1", (workbook_hash, _dumps(params), CACHE_VERSION)).fetchone()
+        return row[0] if row else None
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            results, = conn.execute("SELECT COUNT(*) FROM results").fetchone()
+            cells, = conn.execute("SELECT COUNT(*) FROM cells").fetchone()
+        return {"results": results, "cells": cells}
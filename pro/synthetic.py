@@ -0,0 +1,121 @@
+# Synthetic college workbooks at any size, for benchmarks and the sample
+# download. Every sheet in sheets.REQUIRED_SHEETS is written, and the Lab
+# Rooms sheet when rooms are asked for.
+#
+#   cd pro && python synthetic.py college.xlsx --sections 40 --labs 1
+import argparse
+import random
+
+import pandas as pd
+
+from loader import from_frames
+
+YEARS = ["I", "II", "III", "IV"]
+
+
+# Sheet frames for a synthetic college: `sections` sections spread over
+# years/departments, each with `subjects` theory subjects and `labs` labs,
+# drawing faculty from a pool of `faculty` teachers. A `part_time` share of
+# the teachers cannot teach on one weekday nor in the first period of
+# another, and teach at most 5 periods a day. With `lab_rooms`, every lab
+# shares that many single rooms instead of having a room of its own; with
+# `lab_slots`, lab sessions take that many slots. With `theory_labs` the labs
+# are those of the first theory subjects, under the same Subject ID.
+def synthetic_frames(sections=8, subjects=5, labs=1, faculty=None, slots_per_day=8,
+                     sections_per_department=3, part_time=0.0, lab_rooms=0, lab_slots=None, theory_labs=False,
+                     seed=0):
+    rnd = random.Random(seed)
+    faculty = faculty or max(2, sections * (subjects + labs) // 3)
+    faculty_ids = [f"F{i:04d}" for i in range(1, faculty + 1)]
+
+    section_rows = []
+    for i in range(sections):
+        department = f"D{i // (sections_per_department * len(YEARS)):02d}"
+        year = YEARS[(i // sections_per_department) % len(YEARS)]
+        section_rows.append({"Year": year, "Department": department, "Section": chr(65 + i % sections_per_department)})
+
+    # Break after the third slot and lunch in the middle of the day
+    lunch = slots_per_day // 2 + 2
+    slot_rows = [
+        {"Slot ID": i, "Break Type": "Break" if i == 3 else "Lunch" if i == lunch else "None"}
+        for i in range(1, slots_per_day + 1)
+    ]
+
+    subject_rows = {}
+    section_subject_rows, lab_rows, fixed_rows = [], [], []
+    for row in section_rows:
+        prefix = f"{row['Year']}{row['Department']}"
+        for k in range(subjects):
+            subject_id = f"{prefix}S{k}"
+            subject_rows[subject_id] = f"Subject {prefix}-{k}"
+            section_subject_rows.append(dict(row, **{"Subject ID": subject_id, "Faculty ID": rnd.choice(faculty_ids)}))
+        for k in range(labs):
+            subject_id = f"{prefix}S{k}" if theory_labs and k < subjects else f"{prefix}L{k}"
+            subject_rows.setdefault(subject_id, f"Lab {prefix}-{k}")
+            lab_rows.append(dict(row, **{"Subject ID": subject_id, "Faculty ID": rnd.choice(faculty_ids),
+                                         "Duration": lab_slots, "Room": None}))
+        fixed_rows.append(dict(row, **{"Day": "Saturday", "Slot ID": slots_per_day, "Activity": "Sports"}))
+
+    weekly_rows = []
+    for year in YEARS:
+        subject_rows[f"{year}W"] = f"Weekly {year}"
+        weekly_rows.append({"Year": year, "Subject ID": f"{year}W"})
+
+    teacher_rows = [{"Faculty ID": f, "Faculty Name": f"Teacher {f}", "Unavailable": None,
+                     "Max Periods Per Day": None, "Max Periods Per Week": None} for f in faculty_ids]
+    for row in rnd.sample(teacher_rows, int(len(teacher_rows) * part_time)):
+        off, late = rnd.sample(["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"], 2)
+        row.update({"Unavailable": f"{off}; {late} 1", "Max Periods Per Day": 5})
+
+    theory_names = sorted({subject_rows[r["Subject ID"]] for r in section_subject_rows})
+    frames = {
+        "Sections Data": pd.DataFrame(section_rows),
+        "Subjects Data": pd.DataFrame({"Subject ID": list(subject_rows), "Subject Name": list(subject_rows.values())}),
+        "Teachers Data": pd.DataFrame(teacher_rows),
+        "Time Slot Data": pd.DataFrame(slot_rows),
+        "Section Subjects Data": pd.DataFrame(section_subject_rows),
+        "Fixed Activities": pd.DataFrame(fixed_rows),
+        "Lab Sessions": pd.DataFrame(lab_rows, columns=["Year", "Department", "Section", "Subject ID", "Faculty ID",
+                                                        "Duration", "Room"]),
+        "WeeklyOnce Subjects": pd.DataFrame(weekly_rows),
+        "Target Subjects": pd.DataFrame({"Target Subjects": theory_names}),
+    }
+    if lab_rooms:
+        frames["Lab Rooms"] = pd.DataFrame({"Room": [f"Lab {i}" for i in range(1, lab_rooms + 1)],
+                                            "Capacity": 1})
+    return frames
+
+
+def synthetic_data(**kwargs):
+    return from_frames(synthetic_frames(**kwargs))
+
+
+# Write the sheets as an .xlsx workbook; `out` is a path or binary file
+def write_workbook(out, **kwargs):
+    frames = synthetic_frames(**kwargs)
+    with pd.ExcelWriter(out, engine="openpyxl") as writer:
+        for sheet, frame in frames.items():
+            frame.to_excel(writer, sheet_name=sheet, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out")
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--subjects", type=int, default=5)
+    parser.add_argument("--labs", type=int, default=1)
+    parser.add_argument("--faculty", type=int, default=None)
+    parser.add_argument("--slots-per-day", type=int, default=8)
+    parser.add_argument("--part-time", type=float, default=0.0, help="share of teachers with limited availability")
+    parser.add_argument("--lab-rooms", type=int, default=0, help="shared lab rooms (default: one room per lab)")
+    parser.add_argument("--lab-slots", type=int, default=None, help="slots a lab session takes")
+    parser.add_argument("--theory-labs", action="store_true", help="labs share the Subject ID of a theory subject")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_workbook(args.out, sections=args.sections, subjects=args.subjects, labs=args.labs, faculty=args.faculty,
+                   slots_per_day=args.slots_per_day, part_time=args.part_time, lab_rooms=args.lab_rooms,
+                   lab_slots=args.lab_slots, theory_labs=args.theory_labs, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
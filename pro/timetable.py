@@ -0,0 +1,390 @@
+import logging
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor, wait
+from html import escape
+
+import numpy as np
+import pandas as pd
+from ortools.sat.python import cp_model
+
+from decompose import partition_sections, restrict_problem, combine_status, merge_stats
+from metrics import collecting, count, merge, span
+from result import FREE_PERIOD, TimetableResult
+from loader import WorkbookError, load_timetable_data
+from model_builder import prepare_problem, build_model
+from presolve import check_problem, conflicts_html, explain_infeasible
+from settings import SolverSettings, stats_html
+from solver import STOP_POLL_INTERVAL, solve
+
+
+logger = logging.getLogger(__name__)
+
+# Sections shown in the live preview of an unfinished solve
+PREVIEW_SECTIONS = 10
+
+
+# Sections in output order: grouped by year as listed in "Sections Data"
+def ordered_sections(problem):
+    return [sec for year in problem.years for sec in problem.sections if sec.startswith(f"{year}_")]
+
+
+def is_solved(status, settings, stats=None):
+    # A FEASIBLE status means the time limit hit (or the user stopped the
+    # search) before optimality was proven. A stopped solve always keeps its
+    # best timetable: the user judged it good enough.
+    keep_best = settings.return_best_feasible or bool(stats and stats.get("stopped"))
+    return status == cp_model.OPTIMAL or (status == cp_model.FEASIBLE and keep_best)
+
+
+# Every variable value of the last solve, indexed by variable index
+def solution_values(solver):
+    return np.asarray(solver.response_proto.solution, dtype=np.int8)
+
+
+# Write labels into grid cells whose variable is 1. A var table row's
+# section is mapped to its grid row by section_row, its subject to a label.
+# width is the slots a row fills, one for all rows or an array of them.
+def _place(grid, values, table, section_row, labels, width=1):
+    chosen = values[table.var] == 1
+    width = np.broadcast_to(width, chosen.shape)[chosen]
+    rows, day, slot = section_row[table.section[chosen]], table.day[chosen], table.slot[chosen]
+    label = labels[table.subject[chosen]]
+    for offset in range(int(width.max(initial=0))):
+        fill = width > offset
+        grid[rows[fill], day[fill], slot[fill] + offset] = label[fill]
+
+
+# Read the solved model back into one Days x Slots DataFrame per section.
+# Values are read in one bulk call and every section grid is filled with
+# array writes from the var tables: regular subjects, Weekly Once and labs,
+# then fixed activities and breaks. Cells left empty are free periods.
+def extract_timetables(problem, timetable_model, solver, values=None):
+    if values is None:
+        values = solution_values(solver)
+    compiled = timetable_model.compiled
+    sections = ordered_sections(problem)
+    days, slot_ids = compiled.days, compiled.slots
+    section_pos = {section: i for i, section in enumerate(sections)}
+    day_pos = {day: i for i, day in enumerate(days)}
+    slot_pos = {slot: i for i, slot in enumerate(slot_ids)}
+    section_row = np.array([section_pos[section] for section in compiled.sections], dtype=np.int64)
+    grid = np.full((len(sections), len(days), len(slot_ids)), None, dtype=object)
+
+    def labels(default, suffix=""):
+        return np.array([f"{problem.subject_dict.get(subject_id, default)}{suffix}" for subject_id in compiled.subjects],
+                        dtype=object)
+
+    _place(grid, values, timetable_model.regular, section_row, labels("Unknown Subject"))
+    _place(grid, values, timetable_model.weekly, section_row, labels("Unknown Weekly Once"))
+    _place(grid, values, timetable_model.labs, section_row, labels("Unknown Lab", " (Lab)"),
+           width=compiled.lab_slots[timetable_model.labs.row])
+
+    # Handle fixed activities, then breaks and lunch
+    for section, by_day in problem.fixed_activities.items():
+        if section not in section_pos:
+            continue
+        for day, activities in by_day.items():
+            for slot, activity in activities.items():
+                if day in day_pos and slot in slot_pos:
+                    grid[section_pos[section], day_pos[day], slot_pos[slot]] = activity
+    for ts in problem.timeslots_data:
+        if ts.get("Break Type", "None") in ["Break", "Lunch"]:
+            grid[:, :, slot_pos[ts["Slot ID"]]] = ts["Break Type"]
+
+    grid[pd.isna(grid)] = FREE_PERIOD
+
+    return {
+        section: pd.DataFrame(grid[i], index=days, columns=slot_ids, dtype=object)
+        for i, section in enumerate(sections)
+    }
+
+
+# The solved placement as (section, subject_id, day, slot, ...) tuples of
+# workbook names, a lab listing every slot it takes, and the room of each
+# lab as (section, subject_id, room). Kept with results so an edited
+# timetable can be re-solved from it (see incremental.py).
+def solution_assignment(timetable_model, solver, values=None):
+    if values is None:
+        values = solution_values(solver)
+    compiled = timetable_model.compiled
+
+    def chosen(table, width=1):
+        picked = np.flatnonzero(values[table.var] == 1)
+        width = np.broadcast_to(width, table.var.shape)
+        return [(compiled.sections[table.section[i]], compiled.subjects[table.subject[i]], compiled.days[table.day[i]],
+                 *compiled.slots[table.slot[i]:table.slot[i] + width[i]]) for i in picked]
+
+    labs = timetable_model.labs
+    picked = np.flatnonzero(values[labs.var] == 1)
+    return {
+        "labs": chosen(labs, width=compiled.lab_slots[labs.row]),
+        "lab_rooms": [(compiled.sections[labs.section[i]], compiled.subjects[labs.subject[i]],
+                       compiled.rooms[labs.room[i]]) for i in picked],
+        "weekly": chosen(timetable_model.weekly),
+        "subjects": chosen(timetable_model.regular),
+    }
+
+
+# Build, solve and extract one problem (or one independent component of it)
+def solve_problem(problem, settings, progress=None, prepare_model=None):
+    if progress is None:
+        progress = lambda stage, fraction=None, **info: None
+    progress("building", 0.2)
+    with span("build"):
+        timetable_model = build_model(problem, settings.faculty_mode, settings.soft_weights())
+        if prepare_model is not None:
+            prepare_model(timetable_model)  # e.g. warm-start hints for a re-solve
+    count("model_variables", len(timetable_model.model.proto.variables))
+    count("model_constraints", len(timetable_model.model.proto.constraints))
+    progress("solving", 0.4)
+
+    # Background jobs stream each improving timetable and can be stopped early
+    on_solution = None
+    report = getattr(progress, "solution", None)
+    if report is not None:
+        preview_sections = getattr(progress, "preview_sections", PREVIEW_SECTIONS)
+
+        def on_solution(info, values):
+            html = ""
+            if preview_sections:
+                html = preview_html(extract_timetables(problem, timetable_model, None, values), preview_sections)
+            report(**info, html=html)
+
+    with span("solve"):
+        solver, status, stats = solve(timetable_model.model, settings, on_solution,
+                                      getattr(progress, "stop_requested", None))
+    if not is_solved(status, settings, stats):
+        return status, stats, {}, None
+    with span("extract"):
+        values = solution_values(solver)
+        timetables = extract_timetables(problem, timetable_model, solver, values)
+        assignment = solution_assignment(timetable_model, solver, values)
+    return status, stats, timetables, assignment
+
+
+# The progress callback of one component of a decomposed solve, or of one
+# workbook of a batch. Its improving timetables go to publish(index, info)
+# when given (previews of preview_sections sections, none when 0). Once
+# stop() is set the part stops as soon as it has a timetable, so a stopped
+# solve still covers every section. Stages are not reported; the parts overlap.
+class ComponentProgress:
+    def __init__(self, index, publish, stop, preview_sections):
+        self.index = index
+        self.publish = publish
+        self.stop = stop
+        self.preview_sections = preview_sections
+        self.found = False
+
+    def __call__(self, stage, fraction=None, **info):
+        pass
+
+    def solution(self, **info):
+        self.found = True
+        if self.publish is not None:
+            self.publish(self.index, info)
+
+    def stop_requested(self):
+        return self.found and self.stop()
+
+
+# Reports the parts' latest solutions as one: objective, bound and solution
+# count add up over the parts that have a timetable so far, and the preview
+# shows each of them
+class CombinedSolutions:
+    def __init__(self, parts, progress):
+        self.latest = [None] * parts
+        self.report = getattr(progress, "solution", None)
+
+    def publish(self, index, info):
+        self.latest[index] = info
+        found = [info for info in self.latest if info is not None]
+        if self.report is not None:
+            self.report(objective=sum(info["objective"] for info in found),
+                        bound=sum(info["bound"] for info in found),
+                        elapsed=max(info["elapsed"] for info in found),
+                        solutions=sum(info["solutions"] for info in found),
+                        html="".join(info["html"] for info in found))
+
+
+# Stop flag and solution queue shared with the processes solving components
+# (set by _init_component in each one)
+_component_stop = None
+_component_solutions = None
+
+
+def _init_component(stop, solutions):
+    global _component_stop, _component_solutions
+    _component_stop = stop
+    _component_solutions = solutions
+
+
+# solve_problem in a child process, returning its spans and counters too
+def _solve_component(index, problem, settings, preview_sections):
+    publish = (lambda index, info: _component_solutions.put((index, info))) if preview_sections else None
+    progress = ComponentProgress(index, publish, _component_stop.is_set, preview_sections)
+    with collecting() as collected:
+        return solve_problem(problem, settings, progress), collected
+
+
+# Solve independent components side by side, sharing the worker budget. A
+# stop request reaches every part, and improving timetables are reported
+# as they come, combined by CombinedSolutions.
+def solve_components(problem, settings, components, progress=None):
+    processes, component_settings = settings.split(len(components))
+    subproblems = [restrict_problem(problem, sections) for sections in components]
+    stop_requested = getattr(progress, "stop_requested", None) or (lambda: False)
+    combined = CombinedSolutions(len(subproblems), progress)
+    # Previews only when someone follows the job
+    preview_sections = max(1, PREVIEW_SECTIONS // len(subproblems)) if combined.report is not None else 0
+
+    if processes == 1:
+        results = [solve_problem(sub, component_settings,
+                                 ComponentProgress(i, combined.publish, stop_requested, preview_sections))
+                   for i, sub in enumerate(subproblems)]
+    else:
+        ctx = multiprocessing.get_context()
+        stop, solutions = ctx.Event(), ctx.Queue()
+        with ProcessPoolExecutor(max_workers=processes, mp_context=ctx, initializer=_init_component,
+                                 initargs=(stop, solutions)) as pool:
+            futures = [pool.submit(_solve_component, i, sub, component_settings, preview_sections)
+                       for i, sub in enumerate(subproblems)]
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=STOP_POLL_INTERVAL)
+                if stop_requested():
+                    stop.set()
+                while True:
+                    try:
+                        combined.publish(*solutions.get_nowait())
+                    except queue.Empty:
+                        break
+            results = []
+            for future in futures:
+                result, collected = future.result()
+                results.append(result)
+                merge(collected)  # Spans add up across the parallel parts
+
+    status = combine_status([status for status, _, _, _ in results])
+    stats = merge_stats(status, [stats for _, stats, _, _ in results])
+    merged = {}
+    assignment = {"labs": [], "lab_rooms": [], "weekly": [], "subjects": []}
+    for _, _, timetables, part in results:
+        merged.update(timetables)
+        for kind, keys in (part or {}).items():
+            assignment[kind].extend(keys)
+    timetable_dict = {sec: merged[sec] for sec in ordered_sections(problem) if sec in merged}
+    return status, stats, timetable_dict, assignment
+
+
+# HTML preview of an intermediate solution, limited to the first sections
+def preview_html(timetable_dict, max_sections=PREVIEW_SECTIONS):
+    html = ""
+    for section_key in list(timetable_dict)[:max_sections]:
+        html += f"<h2>Timetable for {section_key}</h2>\n"
+        html += timetable_dict[section_key].to_html(classes="table table-bordered") + "<br><br>"
+    if len(timetable_dict) > max_sections:
+        html += f"<p class=\"text-muted\">Showing {max_sections} of {len(timetable_dict)} sections.</p>"
+    return html
+
+
+# Turn a solve into the result dict handed back to the web tier
+def build_result(problem, settings, status, stats, timetable_dict, progress, conflicts=None, **extra):
+    rooms = {(section, subject_id): room
+             for section, subject_id, room in (extra.get("assignment") or {}).get("lab_rooms", [])}
+    solver_info = {"settings": settings.as_dict(), "stats": stats}
+
+    # Generate timetable output
+    if is_solved(status, settings, stats):
+        progress("rendering", 0.9)
+        if logger.isEnabledFor(logging.DEBUG):
+            for section_key, df_timetable in timetable_dict.items():
+                logger.debug("Timetable for section %s:\n%s", section_key, df_timetable)
+
+        # Keep the timetable as data; exports and per-section HTML are
+        # rendered from it on demand. "html" only holds the solver summary.
+        with span("render"):
+            timetable = TimetableResult.from_frames(problem, timetable_dict, rooms)
+        return dict(extra, status="solved", html=stats_html(settings, stats), timetable=timetable,
+                    solver=solver_info)
+
+    elif status == cp_model.FEASIBLE:
+        return {"status": "timeout", "solver": solver_info,
+                "html": "<p>No optimal timetable found within the time limit.</p>" + stats_html(settings, stats)}
+    elif status == cp_model.UNKNOWN:
+        reason = "before it was stopped" if stats.get("stopped") else "within the time limit"
+        return {"status": "timeout", "solver": solver_info,
+                "html": f"<p>No feasible solution found {reason}.</p>" + stats_html(settings, stats)}
+    else:
+        result = {"status": "infeasible", "html": "<p>No feasible solution found.</p>", "solver": solver_info}
+        if conflicts:
+            result["conflicts"] = conflicts
+            result["html"] += "<p>These requirements cannot all be met together:</p>" + conflicts_html(conflicts)
+        return result
+
+
+# A workbook the presolve checks proved impossible: no model is built or solved
+def rejected_result(settings, conflicts):
+    return {"status": "infeasible", "conflicts": conflicts, "solver": {"settings": settings.as_dict(), "stats": {}},
+            "html": "<p>This workbook cannot be scheduled, so it was not solved:</p>" + conflicts_html(conflicts)}
+
+
+# Minimal conflicting requirements of an infeasible solve, when asked for
+def infeasible_conflicts(problem, settings, status, progress):
+    if status != cp_model.INFEASIBLE or not settings.explain:
+        return None
+    progress("explaining", 0.8)
+    with span("explain"):
+        return explain_infeasible(problem, settings)
+
+
+# Function to generate the timetable
+def generate_timetable(file_path, settings=None, progress=None, prepare=None):
+    # Optional progress(stage, fraction) callback, used by background jobs;
+    # optional prepare(problem) adjusts the problem before it is checked and solved
+    if progress is None:
+        progress = lambda stage, fraction=None, **info: None
+    if settings is None:
+        settings = SolverSettings()
+    with collecting() as collected:
+        try:
+            # Load every sheet of the workbook in one pass
+            progress("loading", 0.05)
+            with span("parse"):
+                data = load_timetable_data(file_path)
+            with span("prepare"):
+                problem = prepare_problem(data)
+                if prepare is not None:
+                    prepare(problem)
+            with span("presolve"):
+                conflicts = check_problem(problem, settings.faculty_mode)
+            if conflicts:
+                result = rejected_result(settings, conflicts)
+            else:
+                # Build and solve, split into independent parts when asked to
+                components = partition_sections(problem) if settings.decompose else [problem.sections]
+                if len(components) > 1:
+                    progress("solving", 0.2, components=len(components))
+                    status, stats, timetable_dict, assignment = solve_components(problem, settings, components, progress)
+                else:
+                    status, stats, timetable_dict, assignment = solve_problem(problem, settings, progress)
+
+                result = build_result(problem, settings, status, stats, timetable_dict, progress,
+                                      infeasible_conflicts(problem, settings, status, progress),
+                                      workbook=file_path, assignment=assignment)
+
+        except Exception as e:
+            if isinstance(e, WorkbookError):
+                logger.warning("Invalid workbook %s: %s", file_path, e)
+            else:
+                logger.exception("Timetable generation failed for %s", file_path)
+            result = {"status": "error", "html": f"<p>Error: {escape(str(e))}</p>"}
+
+    log_result(file_path, result, collected)
+    return dict(result, metrics=collected)
+
+
+def log_result(file_path, result, collected):
+    logger.info("Timetable %s: %s (%s)", os.path.basename(file_path), result["status"],
+                ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in collected["spans"].items()))